@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the project crawler of map_projects.py against a fake organization
+served in-process by fake_gcp.py: wall time, peak memory and RPC counts of a
+full crawl, for every combination of requests in flight and billing lookup.
+
+    python bench_crawler.py --projects 50000 --depth 8 --in-flight 32 128
+    python bench_crawler.py --error-rate 0.01 --cache
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import map_projects
+from fake_gcp import FakeGcp, FakeOrganization
+
+
+@dataclass
+class CrawlResult:
+    name: str
+    seconds: float
+    peak_memory: int
+    projects: int
+    rpcs: Dict[str, int]
+    errors: int
+    retries: int
+
+
+def crawl(
+    name: str,
+    org: FakeOrganization,
+    fakes: FakeGcp,
+    output: str,
+    in_flight: int,
+    billing_lookup: str,
+    rate_limited: bool,
+    cache: Optional[map_projects.ProjectCache] = None,
+) -> CrawlResult:
+    fakes.rpcs.clear()
+    fakes.errors.clear()
+    rate_limits = None
+    if not rate_limited:
+        rate_limits = {api: float("inf") for api in map_projects.API_RATE_LIMITS}
+    session = map_projects.RpcSession(
+        in_flight, map_projects.ClientRegistry(*fakes.clients()), rate_limits
+    )
+    writer = map_projects.JsonLinesProjectWriter(output)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        asyncio.run(
+            map_projects.get_all_projects_async(
+                org.organization_id, session, writer, cache, billing_lookup
+            )
+        )
+    finally:
+        session.close()
+        writer.close()
+    seconds = time.perf_counter() - started
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return CrawlResult(
+        name,
+        seconds,
+        peak_memory,
+        writer.count,
+        dict(fakes.rpcs),
+        sum(fakes.errors.values()),
+        sum(metrics.retries for metrics in session.metrics.values()),
+    )
+
+
+def report(results: List[CrawlResult]) -> None:
+    methods = sorted({method for result in results for method in result.rpcs})
+    width = max((len(method) for method in methods), default=0) + 2
+    print(
+        f"{'run':<32}{'wall (s)':>9}{'peak (MiB)':>11}{'projects':>9}"
+        f"{'rpcs':>8}{'errors':>7}{'retries':>8}"
+    )
+    for result in results:
+        print(
+            f"{result.name:<32}{result.seconds:>9.2f}"
+            f"{result.peak_memory / 2**20:>11.1f}{result.projects:>9}"
+            f"{sum(result.rpcs.values()):>8}{result.errors:>7}{result.retries:>8}"
+        )
+    print()
+    print(
+        f"{'rpcs by method':<32}" + "".join(f"{method:>{width}}" for method in methods)
+    )
+    for result in results:
+        print(
+            f"{result.name:<32}"
+            + "".join(f"{result.rpcs.get(method, 0):>{width}}" for method in methods)
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--projects", type=int, default=5000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--billing-accounts", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per RPC")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--billing-lookup", nargs="+", default=["project", "account"])
+    parser.add_argument(
+        "--rate-limited",
+        action="store_true",
+        help="Apply the API rate limits map_projects.py is configured with",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Also time a cached crawl followed by an incremental re-crawl",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Keep the crawl logs")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    org = FakeOrganization.generate(
+        args.projects, args.depth, args.fanout, args.billing_accounts
+    )
+    fakes = FakeGcp(org, args.latency, args.page_size, args.error_rate)
+    print(
+        f"Organization: {org.folder_count} folders, {org.project_count} projects, "
+        f"{len(org.billing_accounts)} billing accounts, {args.latency * 1000:.0f}ms "
+        f"per RPC, {args.error_rate:.1%} errors"
+    )
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "projects.jsonl")
+        for in_flight in args.in_flight:
+            for billing_lookup in args.billing_lookup:
+                name = f"{billing_lookup} lookup, {in_flight} in flight"
+                results.append(
+                    crawl(
+                        name,
+                        org,
+                        fakes,
+                        output,
+                        in_flight,
+                        billing_lookup,
+                        args.rate_limited,
+                    )
+                )
+        if args.cache:
+            in_flight = max(args.in_flight)
+            billing_lookup = args.billing_lookup[0]
+            cache_file = os.path.join(directory, "cache.sqlite")
+            for name, incremental in (("cached", False), ("incremental", True)):
+                cache = map_projects.ProjectCache(
+                    cache_file, org.organization_id, incremental=incremental
+                )
+                try:
+                    results.append(
+                        crawl(
+                            f"{name}, {in_flight} in flight",
+                            org,
+                            fakes,
+                            output,
+                            in_flight,
+                            billing_lookup,
+                            args.rate_limited,
+                            cache,
+                        )
+                    )
+                finally:
+                    cache.close()
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
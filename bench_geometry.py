@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the geometry the bot runs every turn, on a seeded random state:
+Location against the original dataclass, the monster grid queries against
+always scanning the monsters and always visiting the grid buckets, for growing
+monster counts, and the per call cost of the swept safety check and of the
+beam search move generation.
+
+    python bench_geometry.py
+"""
+from __future__ import annotations
+import math
+import random
+import sys
+import timeit
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from main import (
+    BeamSearch,
+    Consts,
+    CreatureDetail,
+    GridItem,
+    Location,
+    ScoreTable,
+    SpatialGrid,
+    TrackedMonster,
+    TurnClock,
+    closest_approach,
+    pick_safe_candidate,
+)
+
+MONSTERS = 6
+FISH = 12
+
+
+@dataclass
+class LegacyLocation:
+    """
+    Location as it was before the geometry kernel, kept as the baseline.
+    """
+
+    x: int
+    y: int
+
+    def distance(self, other: LegacyLocation):
+        x_distance = abs(self.x - other.x)
+        y_distance = abs(self.y - other.y)
+        return math.ceil(math.sqrt(x_distance**2 + y_distance**2))
+
+    def add(self, location: LegacyLocation) -> LegacyLocation:
+        return LegacyLocation(x=self.x + location.x, y=self.y + location.y)
+
+    def towards(self, dest: LegacyLocation, speed: int):
+        if dest.distance(self) <= speed:
+            return dest
+        angle = (
+            math.atan((self.y - dest.y) / max(0.1, (dest.x - self.x))) * 180 / math.pi
+        )
+        return self.get_angle_location(angle, speed)
+
+    def get_angle_location(self, angle: float, radius: int) -> LegacyLocation:
+        x = math.floor(radius * math.cos(angle))
+        y = math.floor(radius * math.sin(angle))
+        return self.add(LegacyLocation(x=x, y=y))
+
+
+def location_cases(cls: type) -> List[Tuple[str, Callable[[], object]]]:
+    """
+    The Location operations of a turn: parsing creates them, DirectionData
+    measures distances and find_safe_dest steps towards the destination.
+    """
+    generator = random.Random(0)
+    points = [
+        cls(generator.randrange(Consts.MAP_SIZE), generator.randrange(Consts.MAP_SIZE))
+        for _ in range(64)
+    ]
+    origin = cls(5000, 5000)
+    return [
+        ("create", lambda: [cls(i, i) for i in range(64)]),
+        ("distance", lambda: [p.distance(origin) for p in points]),
+        ("towards", lambda: [origin.towards(p, Consts.DRONE_SPEED) for p in points]),
+    ]
+
+
+def random_monsters(
+    generator: random.Random,
+    origin: Location,
+    count: int = MONSTERS,
+    spread: int = 1500,
+) -> List[GridItem]:
+    """
+    Monsters in their habitat, within spread of the drone at origin on both
+    axes. The default ones are close enough for find_safe_dest to look for a
+    detour.
+    """
+    return [
+        (
+            creature_id,
+            origin.x + generator.randint(-spread, spread),
+            max(
+                Consts.MONSTER_HABITAT_TOP,
+                origin.y + generator.randint(-spread, spread),
+            ),
+        )
+        for creature_id in range(count)
+    ]
+
+
+def grid_cases(
+    generator: random.Random, origin: Location, count: int
+) -> List[Tuple[str, Callable[[], object], Callable[[], object], Callable[[], object]]]:
+    """
+    The monster queries of find_safe_dest on SpatialGrid as the bot uses it,
+    which scans up to SCAN_MAX_ITEMS monsters, and on the same grid forced to
+    always scan the monster list or always visit the buckets.
+    """
+    items = random_monsters(generator, origin, count, spread=4000)
+    grids = []
+    for scan_max_items in (math.inf, -1, SpatialGrid.SCAN_MAX_ITEMS):
+        grid = SpatialGrid(Consts.MONSTER_ATTACK_RANGE)
+        grid.SCAN_MAX_ITEMS = scan_max_items
+        grid.rebuild(items)
+        grids.append(grid)
+    end = origin.towards(Location(9000, 9000), Consts.DRONE_SPEED)
+    reach = Consts.MONSTER_ATTACK_RANGE + Consts.MONSTER_MAX_SPEED
+    radius = max(Consts.SAFE_DEST_RADII) + reach
+    scan, buckets, grid = grids
+    return [
+        (
+            "near_segment",
+            lambda: scan.near_segment(origin, end, reach),
+            lambda: buckets.near_segment(origin, end, reach),
+            lambda: grid.near_segment(origin, end, reach),
+        ),
+        (
+            "within",
+            lambda: scan.within(origin.x, origin.y, radius),
+            lambda: buckets.within(origin.x, origin.y, radius),
+            lambda: grid.within(origin.x, origin.y, radius),
+        ),
+    ]
+
+
+def kernel_cases(
+    generator: random.Random, origin: Location
+) -> List[Tuple[str, Callable[[], object]]]:
+    """
+    The swept safety check of find_safe_dest, and a beam search expansion of
+    one drone with an empty transposition table.
+    """
+    items = random_monsters(generator, origin)
+    monsters = np.array([(x, y) for _, x, y in items], dtype=np.int64)
+    speeds = np.array(
+        [(generator.randint(-540, 540), generator.randint(-540, 540)) for _ in items],
+        dtype=np.int64,
+    )
+    end = np.array([(origin.x + Consts.DRONE_SPEED, origin.y)], dtype=np.int64)
+    dest = Location(9000, 9000)
+
+    fish_details = {
+        creature_id: CreatureDetail(creature_id % 4, creature_id // 4)
+        for creature_id in range(FISH)
+    }
+    targets = {
+        creature_id: Location(
+            generator.randrange(Consts.MAP_SIZE), generator.randrange(Consts.MAP_SIZE)
+        )
+        for creature_id in fish_details
+    }
+    tracked = [
+        TrackedMonster(creature_id, Location(x, y), Location(int(vx), int(vy)))
+        for (creature_id, x, y), (vx, vy) in zip(items, speeds)
+    ]
+    clock = TurnClock()
+    clock.start(clock.started, budget=math.inf)
+    search = BeamSearch(ScoreTable(fish_details), 0, 0, targets, tracked, clock)
+
+    def drone_moves() -> object:
+        search.transitions.clear()
+        return search.drone_moves(0, origin.x, origin.y)
+
+    return [
+        (
+            "closest_approach",
+            lambda: closest_approach(origin, end, monsters, speeds),
+        ),
+        (
+            "pick_safe_candidate",
+            lambda: pick_safe_candidate(
+                origin, dest, monsters, speeds, Consts.MONSTER_ATTACK_RANGE
+            ),
+        ),
+        ("drone_moves", drone_moves),
+    ]
+
+
+def best_time(function: Callable[[], object], number: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=7)) / number
+
+
+def instance_size(location: object) -> int:
+    size = sys.getsizeof(location)
+    if hasattr(location, "__dict__"):
+        size += sys.getsizeof(location.__dict__)
+    return size
+
+
+def main() -> None:
+    number = 2000
+    print(
+        f"{'location, 64 points':<22}{'legacy (us)':>12}{'slotted (us)':>14}{'speedup':>10}"
+    )
+    for (name, legacy), (_, slotted) in zip(
+        location_cases(LegacyLocation), location_cases(Location)
+    ):
+        legacy_time = best_time(legacy, number) * 1e6
+        slotted_time = best_time(slotted, number) * 1e6
+        print(
+            f"{name:<22}{legacy_time:>12.2f}{slotted_time:>14.2f}"
+            f"{legacy_time / slotted_time:>9.2f}x"
+        )
+    print(
+        f"{'bytes per instance':<22}{instance_size(LegacyLocation(1, 2)):>12}"
+        f"{instance_size(Location(1, 2)):>14}"
+    )
+
+    generator = random.Random(0)
+    origin = Location(5000, 6000)
+    print()
+    print(
+        f"{'monster query':<22}{'scan (us)':>12}{'buckets (us)':>14}"
+        f"{'grid (us)':>12}{'vs scan':>10}{'vs buckets':>12}"
+    )
+    for count in (MONSTERS, SpatialGrid.SCAN_MAX_ITEMS, 12, 24, 48, 96, 192):
+        for name, scan, buckets, grid in grid_cases(generator, origin, count):
+            scan_time = best_time(scan, number) * 1e6
+            buckets_time = best_time(buckets, number) * 1e6
+            grid_time = best_time(grid, number) * 1e6
+            print(
+                f"{f'{name}, {count}':<22}{scan_time:>12.2f}{buckets_time:>14.2f}"
+                f"{grid_time:>12.2f}{scan_time / grid_time:>9.2f}x"
+                f"{buckets_time / grid_time:>11.2f}x"
+            )
+
+    print()
+    print(f"{'per call':<22}{'time (us)':>12}")
+    for name, kernel in kernel_cases(generator, origin):
+        print(f"{name:<22}{best_time(kernel, number // 4) * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
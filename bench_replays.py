@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmarks a bot on a corpus of recorded games: per-turn latency and peak
+memory percentiles, and how many turns its actions differ from the recording
+and, when given, from a baseline version of the bot.
+
+    python run_matches.py --games 50 --record games
+    python bench_replays.py 'games/*.replay.gz' --bot main.py --baseline old_main.py
+"""
+from __future__ import annotations
+import argparse
+import glob
+from typing import List, Optional
+
+from replay import TurnResult, load_bot, load_replay, replay_game
+from run_matches import percentile
+
+
+def summary(name: str, results: List[TurnResult]) -> None:
+    latencies = [result.latency * 1000 for result in results]
+    memory = [result.peak_memory / 1024 for result in results if result.peak_memory]
+    print(
+        f"{name:<10} turns {len(results)} | latency "
+        f"p50 {percentile(latencies, 0.5):.2f}ms "
+        f"p99 {percentile(latencies, 0.99):.2f}ms "
+        f"max {max(latencies, default=0.0):.2f}ms | peak memory "
+        f"p50 {percentile(memory, 0.5):.1f}KiB "
+        f"p99 {percentile(memory, 0.99):.1f}KiB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("replays", help="Glob of the replay files to play")
+    parser.add_argument("--bot", default="main.py")
+    parser.add_argument(
+        "--baseline",
+        help="Bot script to compare actions and timings with, it must provide"
+        " Bot.from_stream, as main.py does",
+    )
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.replays))
+    if not paths:
+        parser.error(f"No replay matches {args.replays}")
+    bots = {"bot": load_bot(args.bot)}
+    if args.baseline:
+        bots["baseline"] = load_bot(args.baseline)
+
+    results = {name: [] for name in bots}
+    differs_from_recording = 0
+    differs_from_baseline = 0
+    for path in paths:
+        replay = load_replay(path)
+        played = {}
+        for name, bot in bots.items():
+            # Time the turns untraced, tracemalloc slows allocations down a lot.
+            timed = replay_game(replay, bot)
+            traced = replay_game(replay, bot, trace_memory=True)
+            for timed_turn, traced_turn in zip(timed, traced):
+                timed_turn.peak_memory = traced_turn.peak_memory
+            results[name].extend(timed)
+            played[name] = timed
+        for index, recorded in enumerate(replay.turns):
+            bot_output = played["bot"][index].output
+            differs_from_recording += bot_output != recorded.output
+            baseline: Optional[List[TurnResult]] = played.get("baseline")
+            if baseline is not None:
+                differs_from_baseline += bot_output != baseline[index].output
+
+    total_turns = len(results["bot"])
+    print(f"Replays: {len(paths)}, turns: {total_turns}")
+    for name, bot_results in results.items():
+        summary(name, bot_results)
+    print(f"Turns whose actions differ from the recording: {differs_from_recording}")
+    if args.baseline:
+        print(f"Turns whose actions differ from the baseline:  {differs_from_baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+In-process stand-ins for the FoldersClient, ProjectsClient and CloudBillingClient
+that map_projects.py calls, serving a synthetic organization tree with per-call
+latency, pagination and injected errors, and counting every RPC.
+
+    org = FakeOrganization.generate(projects=50000, depth=8, fanout=3)
+    fakes = FakeGcp(org, latency=0.02, error_rate=0.01)
+    session = RpcSession(clients=ClientRegistry(*fakes.clients()))
+"""
+from __future__ import annotations
+import datetime
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, List, Sequence, Tuple, TypeVar
+
+from google.api_core import exceptions as api_exceptions
+
+T = TypeVar("T")
+
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@dataclass
+class FakeFolder:
+    name: str
+
+
+@dataclass
+class FakeProject:
+    project_id: str
+    display_name: str
+    labels: Dict[str, str]
+    update_time: datetime.datetime
+    etag: str
+
+
+@dataclass
+class FakeBillingAccount:
+    name: str
+
+
+@dataclass
+class FakeProjectBillingInfo:
+    project_id: str
+    billing_account_name: str
+
+
+@dataclass
+class FakeOrganization:
+    """
+    A synthetic resource tree: the folders and projects under every parent, and
+    the billing account of every project linked to one.
+    """
+
+    organization_id: str
+    folders: Dict[str, List[str]] = field(default_factory=dict)
+    projects: Dict[str, List[FakeProject]] = field(default_factory=dict)
+    billing: Dict[str, str] = field(default_factory=dict)
+    billing_accounts: List[str] = field(default_factory=list)
+
+    @classmethod
+    def generate(
+        cls,
+        projects: int = 1000,
+        depth: int = 4,
+        fanout: int = 3,
+        billing_accounts: int = 3,
+        unlinked: float = 0.05,
+        seed: int = 0,
+    ) -> FakeOrganization:
+        """
+        An organization with fanout folders under every folder down to depth
+        levels, the projects spread at random over the organization and all its
+        folders, and linked at random to the billing accounts, except for the
+        unlinked fraction of them.
+        """
+        generator = random.Random(seed)
+        org = cls("1")
+        root = f"organizations/{org.organization_id}"
+        parents = [root]
+        level = [root]
+        for _ in range(depth):
+            next_level = []
+            for parent in level:
+                children = [
+                    f"folders/{len(parents) + index}" for index in range(fanout)
+                ]
+                org.folders[parent] = children
+                parents.extend(children)
+                next_level.extend(children)
+            level = next_level
+        for parent in parents:
+            org.folders.setdefault(parent, [])
+            org.projects[parent] = []
+
+        org.billing_accounts = [
+            f"billingAccounts/{index:06X}-000000-000000"
+            for index in range(billing_accounts)
+        ]
+        for index in range(projects):
+            project_id = f"project-{index:06d}"
+            org.projects[generator.choice(parents)].append(
+                FakeProject(
+                    project_id=project_id,
+                    display_name=f"Project {index}",
+                    labels={"env": generator.choice(("prod", "staging", "dev"))},
+                    update_time=EPOCH + datetime.timedelta(seconds=index),
+                    etag=f"etag-{index}",
+                )
+            )
+            if org.billing_accounts and generator.random() >= unlinked:
+                org.billing[project_id] = generator.choice(org.billing_accounts)
+        return org
+
+    @property
+    def folder_count(self) -> int:
+        return len(self.folders) - 1
+
+    @property
+    def project_count(self) -> int:
+        return sum(len(projects) for projects in self.projects.values())
+
+
+class FakeGcp:
+    """
+    The fake clients of one organization. Every RPC, a page of a listing or a
+    single get, sleeps for the latency, fails with a retryable error at the
+    error rate, and is counted by method. The clients are called from the
+    worker threads of the crawl, so the counters and the random generator are
+    shared under a lock.
+    """
+
+    def __init__(
+        self,
+        org: FakeOrganization,
+        latency: float = 0.02,
+        page_size: int = 100,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.org = org
+        self.latency = latency
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.rpcs: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+
+    def clients(
+        self,
+    ) -> Tuple[FakeFoldersClient, FakeProjectsClient, FakeBillingClient]:
+        """
+        Folders, projects and billing clients, in the order ClientRegistry takes them.
+        """
+        return (
+            FakeFoldersClient(self),
+            FakeProjectsClient(self),
+            FakeBillingClient(self),
+        )
+
+    def rpc(self, method: str) -> None:
+        with self.lock:
+            self.rpcs[method] += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors[method] += 1
+        time.sleep(self.latency)
+        if failed:
+            raise api_exceptions.ServiceUnavailable(f"Injected error in {method}")
+
+    def page(self, method: str, items: Sequence[T], request) -> Tuple[Sequence[T], str]:
+        """
+        The page of a listing the request asks for, and the token of the next one,
+        empty on the last page. The tokens are offsets into the items.
+        """
+        self.rpc(method)
+        page_size = min(request.page_size or self.page_size, self.page_size)
+        start = int(request.page_token or 0)
+        end = start + page_size
+        return items[start:end], str(end) if end < len(items) else ""
+
+
+class FakeFoldersClient:
+    def __init__(self, gcp: FakeGcp) -> None:
+        self.gcp = gcp
+
+    def list_folders(self, request, retry=None, timeout=None) -> SimpleNamespace:
+        names = self.gcp.org.folders.get(request.parent, [])
+        page, next_page_token = self.gcp.page("list_folders", names, request)
+        return SimpleNamespace(
+            folders=[FakeFolder(name) for name in page], next_page_token=next_page_token
+        )
+
+
+class FakeProjectsClient:
+    def __init__(self, gcp: FakeGcp) -> None:
+        self.gcp = gcp
+
+    def list_projects(self, request, retry=None, timeout=None) -> SimpleNamespace:
+        projects = self.gcp.org.projects.get(request.parent, [])
+        page, next_page_token = self.gcp.page("list_projects", projects, request)
+        return SimpleNamespace(projects=page, next_page_token=next_page_token)
+
+
+class FakeBillingClient:
+    def __init__(self, gcp: FakeGcp) -> None:
+        self.gcp = gcp
+
+    def get_project_billing_info(
+        self, name: str, retry=None, timeout=None
+    ) -> FakeProjectBillingInfo:
+        self.gcp.rpc("get_project_billing_info")
+        project_id = name.split("/")[-1]
+        return FakeProjectBillingInfo(
+            project_id, self.gcp.org.billing.get(project_id, "")
+        )
+
+    def list_billing_accounts(
+        self, request, retry=None, timeout=None
+    ) -> SimpleNamespace:
+        page, next_page_token = self.gcp.page(
+            "list_billing_accounts", self.gcp.org.billing_accounts, request
+        )
+        return SimpleNamespace(
+            billing_accounts=[FakeBillingAccount(name) for name in page],
+            next_page_token=next_page_token,
+        )
+
+    def list_project_billing_info(
+        self, request, retry=None, timeout=None
+    ) -> SimpleNamespace:
+        infos = [
+            FakeProjectBillingInfo(project_id, account)
+            for project_id, account in self.gcp.org.billing.items()
+            if account == request.name
+        ]
+        page, next_page_token = self.gcp.page(
+            "list_project_billing_info", infos, request
+        )
+        return SimpleNamespace(
+            project_billing_info=page, next_page_token=next_page_token
+        )
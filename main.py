@@ -1,10 +1,21 @@
 from __future__ import annotations
-from functools import cached_property
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+import gzip
+import heapq
+from itertools import product
+import json
 import math
-from typing import Any, List, Dict, Optional, Tuple
+import os
+from typing import Any, BinaryIO, Iterator, List, Dict, Optional, TextIO, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import sys
+import time
+
+import numpy as np
 
 
 class Consts:
@@ -12,6 +23,31 @@ class Consts:
     MAP_SIZE = 10000
     MONSTER_TYPE = -1
     MONSTER_ATTACK_RANGE = 500
+    MONSTER_MAX_SPEED = 540
+    MONSTER_HABITAT_TOP = 2500
+    MONSTER_CONFIDENCE_DECAY = 0.85
+    MONSTER_MIN_CONFIDENCE = 0.2
+    SAFE_DEST_RADII = (600, 450, 300, 150)
+    SAFE_DEST_ANGLE_STEP = 6
+    MAX_TURNS = 200
+    FIRST_TURN_BUDGET = 1.0
+    TURN_BUDGET = 0.05
+    TURN_SAFETY_MARGIN = 0.01
+    COLOR_ACHIEVEMENT_POINTS = 3
+    TYPE_ACHIEVEMENT_POINTS = 4
+    SCAN_RANGE = 800
+    FISH_HABITATS = {0: (2500, 5000), 1: (5000, 7500), 2: (7500, 10000)}
+    FISH_SPEED = 200
+    SEARCH_DEPTH = 4
+    SEARCH_BEAM_WIDTH = 12
+    SEARCH_DIRECTIONS = 8
+    SEARCH_MAX_NODES = 6000
+    SEARCH_TIME_RESERVE = 0.015
+    SEARCH_MONSTER_MARGIN = 100
+    SEARCH_GRID = 100
+    SEARCH_SCAN_WEIGHT = 1000
+    ASSIGNMENT_SCAN_WEIGHT = 300
+    FORBIDDEN_COST = 1e9
 
 
 class Direction(Enum):
@@ -21,19 +57,18 @@ class Direction(Enum):
     BOTTOM_RIGHT = "BR"
 
 
-@dataclass
+@dataclass(slots=True)
 class Location:
     x: int
     y: int
 
-    def distance(self, other: Location):
-        x_distance = abs(self.x - other.x)
-        y_distance = abs(self.y - other.y)
-        return math.ceil(math.sqrt(x_distance**2 + y_distance **2))
+    def distance(self, other: Location) -> int:
+        return math.ceil(math.hypot(self.x - other.x, self.y - other.y))
 
-    # def __init__(self, x: int, y: int):
-    #     self.x = max(min(Consts.MAP_SIZE, x), 0)
-    #     self.y = max(min(Consts.MAP_SIZE, y), 0)
+    def distance_squared(self, other: Location) -> int:
+        x_distance = self.x - other.x
+        y_distance = self.y - other.y
+        return x_distance * x_distance + y_distance * y_distance
 
     def is_in_board(self) -> bool:
         return 0 <= self.x < Consts.MAP_SIZE and 0 <= self.y < Consts.MAP_SIZE
@@ -43,29 +78,20 @@ class Location:
 
     def add(self, location: Location) -> Location:
         return Location(x=self.x + location.x, y=self.y + location.y)
-    
-    def towards(self, dest: Location, speed: int):
-        if dest.distance(self) <= speed:
+
+    def move_to(self, x: int, y: int) -> None:
+        self.x = x
+        self.y = y
+
+    def towards(self, dest: Location, speed: int) -> Location:
+        distance_squared = dest.distance_squared(self)
+        if distance_squared <= speed * speed:
             return dest
-        
-        angle = math.atan((self.y - dest.y) / max(0.1, (dest.x - self.x))) * 180 / math.pi
-        return self.get_angle_location(angle, speed)
-    
-    def get_angle_location(self, angle: float, radius: int) -> Location:
-            x = math.floor(radius * math.cos(angle))
-            y = math.floor(radius * math.sin(angle))
-            return self.add(Location(x=x, y=y))
-
-    def generate_circle_locations(self, angle: int = 10, radius: int = Consts.DRONE_SPEED) -> List[Location]:
-        locations: List[Location] = []
-        for a in range(0, 360, angle):
-            loc = self.get_angle_location(angle=a, radius=radius)
-            if loc.is_in_board():
-                locations.append(loc)
-        return locations
-    
-    def is_location_in_range_of_locations(self, locations: List[Location], _range: int):
-        return any(self.distance(location) <= _range for location in locations)
+        ratio = speed / math.sqrt(distance_squared)
+        return Location(
+            x=self.x + math.floor((dest.x - self.x) * ratio),
+            y=self.y + math.floor((dest.y - self.y) * ratio),
+        )
 
 
 @dataclass
@@ -109,6 +135,159 @@ class Drone:
     scans: List[int]
 
 
+@dataclass
+class TrackedMonster:
+    creature_id: int
+    pos: Location
+    speed: Location
+    last_seen_turn: int = 0
+    confidence: float = 0.0
+
+    def extrapolate(self) -> None:
+        """
+        Dead-reckon one turn ahead, bouncing off the monster habitat borders.
+        """
+        x = self.pos.x + self.speed.x
+        y = self.pos.y + self.speed.y
+        if not 0 <= x < Consts.MAP_SIZE:
+            self.speed.x = -self.speed.x
+            x = max(0, min(Consts.MAP_SIZE - 1, x))
+        if not Consts.MONSTER_HABITAT_TOP <= y < Consts.MAP_SIZE:
+            self.speed.y = -self.speed.y
+            y = max(Consts.MONSTER_HABITAT_TOP, min(Consts.MAP_SIZE - 1, y))
+        self.pos.move_to(x, y)
+        self.confidence *= Consts.MONSTER_CONFIDENCE_DECAY
+
+
+class MonsterTracker:
+    """
+    Keeps every monster across turns: the ones in sight are refreshed from the
+    referee, the others are extrapolated from their last known speed with a
+    confidence that decays every turn they stay out of sight.
+    """
+
+    def __init__(self, monster_ids: List[int]) -> None:
+        self.monsters: Dict[int, TrackedMonster] = {
+            creature_id: TrackedMonster(creature_id, Location(0, 0), Location(0, 0))
+            for creature_id in monster_ids
+        }
+
+    def update(self, turn: int, visible_monsters: List[Creature]) -> None:
+        for monster in visible_monsters:
+            tracked = self.monsters[monster.creature_id]
+            tracked.pos.move_to(monster.pos.x, monster.pos.y)
+            tracked.speed.move_to(monster.speed.x, monster.speed.y)
+            tracked.last_seen_turn = turn
+            tracked.confidence = 1.0
+        for tracked in self.monsters.values():
+            if tracked.last_seen_turn != turn and tracked.confidence > 0:
+                tracked.extrapolate()
+
+    def known_monsters(
+        self, min_confidence: float = Consts.MONSTER_MIN_CONFIDENCE
+    ) -> List[TrackedMonster]:
+        return [
+            tracked
+            for tracked in self.monsters.values()
+            if tracked.confidence >= min_confidence
+        ]
+
+
+# Id and position of an item of a SpatialGrid.
+GridItem = Tuple[int, int, int]
+
+
+class SpatialGrid:
+    """
+    Uniform grid of square buckets over the map, so that proximity queries
+    only look at the items of the few cells around the query instead of all
+    of them. Positions off the map are fine, they land in cells off the map.
+    Up to SCAN_MAX_ITEMS items, which covers the monsters of a game, visiting
+    the cells costs more than checking every item, so queries scan the items.
+    """
+
+    SCAN_MAX_ITEMS = 8
+
+    def __init__(self, cell_size: int) -> None:
+        self.cell_size = cell_size
+        self.buckets: Dict[Tuple[int, int], List[GridItem]] = {}
+        self.items: List[GridItem] = []
+        self.size = 0
+
+    def rebuild(self, items: List[GridItem]) -> None:
+        self.buckets.clear()
+        self.items = list(items)
+        self.size = len(items)
+        if self.size <= self.SCAN_MAX_ITEMS:
+            return
+        size = self.cell_size
+        for item in items:
+            key = (item[1] // size, item[2] // size)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = [item]
+            else:
+                bucket.append(item)
+
+    def candidates(
+        self, x_min: int, x_max: int, y_min: int, y_max: int
+    ) -> Iterator[GridItem]:
+        """
+        The items that may lie in the given box: all of them when there are
+        few, else the items of every cell overlapping it.
+        """
+        if self.size <= self.SCAN_MAX_ITEMS:
+            return iter(self.items)
+        return self.cell_items(x_min, x_max, y_min, y_max)
+
+    def cell_items(
+        self, x_min: int, x_max: int, y_min: int, y_max: int
+    ) -> Iterator[GridItem]:
+        size = self.cell_size
+        buckets = self.buckets
+        for cell_x in range(x_min // size, x_max // size + 1):
+            for cell_y in range(y_min // size, y_max // size + 1):
+                bucket = buckets.get((cell_x, cell_y))
+                if bucket is not None:
+                    yield from bucket
+
+    def within(self, x: int, y: int, radius: int) -> List[GridItem]:
+        range_squared = radius * radius
+        return [
+            item
+            for item in self.candidates(x - radius, x + radius, y - radius, y + radius)
+            if (item[1] - x) ** 2 + (item[2] - y) ** 2 <= range_squared
+        ]
+
+    def near_segment(
+        self, start: Location, end: Location, radius: int
+    ) -> List[GridItem]:
+        """
+        The items within radius of any point of the segment from start to end.
+        """
+        x0, y0, x1, y1 = start.x, start.y, end.x, end.y
+        dx = x1 - x0
+        dy = y1 - y0
+        length_squared = dx * dx + dy * dy
+        range_squared = radius * radius
+        found = []
+        for item in self.candidates(
+            min(x0, x1) - radius,
+            max(x0, x1) + radius,
+            min(y0, y1) - radius,
+            max(y0, y1) + radius,
+        ):
+            px = item[1] - x0
+            py = item[2] - y0
+            if length_squared:
+                t = max(0.0, min(1.0, (px * dx + py * dy) / length_squared))
+                px -= t * dx
+                py -= t * dy
+            if px * px + py * py <= range_squared:
+                found.append(item)
+        return found
+
+
 @dataclass
 class DirectionData:
     direction: Direction
@@ -139,8 +318,408 @@ class DirectionData:
             raise ValueError(f"Unsupported direction {direction}")
 
 
-def debug(message: Any):
-    print(message, file=sys.stderr)
+def circle_offsets(radii: Tuple[int, ...], angle_step: int) -> List[np.ndarray]:
+    """
+    Offsets of the points on circles of the given radii around (0, 0), one
+    (n, 2) int array per circle, preceded by (0, 0) itself.
+    """
+    angles = np.radians(np.arange(0, 360, angle_step))
+    unit = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    rings = [np.floor(unit * radius).astype(np.int64) for radius in radii]
+    return [np.zeros((1, 2), dtype=np.int64), *rings]
+
+
+SAFE_DEST_RINGS = circle_offsets(Consts.SAFE_DEST_RADII, Consts.SAFE_DEST_ANGLE_STEP)
+
+
+def closest_approach(
+    origin: Location, ends: np.ndarray, monsters: np.ndarray, speeds: np.ndarray
+) -> np.ndarray:
+    """
+    Squared distance at the closest approach during the turn between a drone
+    moving from origin to each of the (n, 2) ends and each of the (m, 2)
+    monsters moving at their speeds, as an (n, m) array. Both move in a straight
+    line at constant speed, as the referee moves them, so their relative motion
+    is a segment too.
+    """
+    relative = np.array((origin.x, origin.y), dtype=np.float64) - monsters
+    motion = (ends - (origin.x, origin.y))[:, None, :] - speeds[None, :, :]
+    motion_squared = (motion * motion).sum(axis=2)
+    # Time of the closest approach, 0 when the drone and monster move alike.
+    t = -(motion * relative[None, :, :]).sum(axis=2) / np.maximum(motion_squared, 1)
+    np.clip(t, 0.0, 1.0, out=t)
+    closest = relative[None, :, :] + t[:, :, None] * motion
+    return (closest * closest).sum(axis=2)
+
+
+def pick_safe_candidate(
+    origin: Location,
+    dest: Location,
+    monsters: np.ndarray,
+    speeds: np.ndarray,
+    _range: int,
+    clock: Optional[TurnClock] = None,
+) -> Location:
+    """
+    Sweep the moves from origin to the candidates around it against all
+    monster moves at once, a circle at a time, and return the candidate closest
+    to dest that no monster comes in range of during the turn. If there is
+    none, return the one that keeps furthest from the nearest monster. Stops
+    early with the best candidate so far when the turn clock runs out.
+    """
+    best_safe: Optional[Tuple[int, np.ndarray]] = None
+    best_unsafe: Optional[Tuple[int, np.ndarray]] = None
+    for offsets in SAFE_DEST_RINGS:
+        candidates = np.clip(offsets + (origin.x, origin.y), 0, Consts.MAP_SIZE - 1)
+        nearest_monster = closest_approach(origin, candidates, monsters, speeds).min(
+            axis=1
+        )
+        safe = nearest_monster > _range * _range
+        if safe.any():
+            to_dest = candidates[safe] - (dest.x, dest.y)
+            dest_distance = (to_dest * to_dest).sum(axis=1)
+            index = int(np.argmin(dest_distance))
+            if best_safe is None or dest_distance[index] < best_safe[0]:
+                best_safe = (int(dest_distance[index]), candidates[safe][index])
+        elif best_safe is None:
+            index = int(np.argmax(nearest_monster))
+            if best_unsafe is None or nearest_monster[index] > best_unsafe[0]:
+                best_unsafe = (int(nearest_monster[index]), candidates[index])
+        if clock is not None and clock.expired():
+            break
+    _, best = best_safe or best_unsafe
+    return Location(int(best[0]), int(best[1]))
+
+
+class TurnClock:
+    """
+    Time budget of the current turn, started when the first byte of the turn
+    input arrived. Times the phases of every turn into histograms, and lets
+    anytime searches check how much of the budget is left.
+    """
+
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50)
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.deadline = self.started
+        self.histograms: Dict[str, List[int]] = {}
+        self.totals: Dict[str, float] = {}
+        self.maximums: Dict[str, float] = {}
+
+    def start(self, started: float, budget: float) -> None:
+        self.started = started
+        self.deadline = started + budget - Consts.TURN_SAFETY_MARGIN
+
+    def remaining(self) -> float:
+        return self.deadline - time.perf_counter()
+
+    def expired(self) -> bool:
+        return time.perf_counter() >= self.deadline
+
+    def record(self, phase: str, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        counts = self.histograms.setdefault(phase, [0] * (len(self.BUCKETS_MS) + 1))
+        counts[bisect_left(self.BUCKETS_MS, milliseconds)] += 1
+        self.totals[phase] = self.totals.get(phase, 0.0) + milliseconds
+        self.maximums[phase] = max(self.maximums.get(phase, 0.0), milliseconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def end_turn(self) -> None:
+        self.record("turn", time.perf_counter() - self.started)
+
+    def report(self) -> str:
+        header = " ".join(f"<={bucket}" for bucket in self.BUCKETS_MS)
+        header += f" >{self.BUCKETS_MS[-1]}"
+        lines = [f"phase count mean max (ms) | {header}"]
+        for phase, counts in self.histograms.items():
+            count = sum(counts)
+            mean = self.totals[phase] / count
+            lines.append(
+                f"{phase} {count} {mean:.3f} {self.maximums[phase]:.3f} | "
+                + " ".join(map(str, counts))
+            )
+        return "\n".join(lines)
+
+
+class ProtocolReader:
+    """
+    Token stream over the referee input. Reads whatever the referee has already
+    written in one go and splits it into tokens in bulk, instead of an input()
+    call per line.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self.stream = stream
+        self.tokens: List[bytes] = []
+        self.index = 0
+        self.partial = b""
+        self.received_at = time.perf_counter()
+        # Tokens consumed since the last take_consumed(), kept for the recorder.
+        self.recording = False
+        self.consumed: List[bytes] = []
+
+    def fill(self) -> None:
+        chunk = self.stream.read1(self.CHUNK_SIZE)
+        self.received_at = time.perf_counter()
+        if not chunk:
+            if not self.partial:
+                raise EOFError("Referee closed the input stream")
+            self.tokens.append(self.partial)
+            self.partial = b""
+            return
+        data = self.partial + chunk
+        tokens = data.split()
+        # A token cut in the middle by the chunk boundary waits for the next read.
+        self.partial = b"" if data[-1:].isspace() else tokens.pop()
+        del self.tokens[: self.index]
+        self.index = 0
+        self.tokens.extend(tokens)
+
+    def wait(self) -> float:
+        """
+        Block until input is available, and return when it was received.
+        """
+        while self.index >= len(self.tokens):
+            self.fill()
+        return self.received_at
+
+    def next_ints(self, count: int) -> List[int]:
+        while len(self.tokens) - self.index < count:
+            self.fill()
+        start = self.index
+        self.index += count
+        if self.recording:
+            self.consumed.extend(self.tokens[start : self.index])
+        return list(map(int, self.tokens[start : self.index]))
+
+    def next_int(self) -> int:
+        return self.next_ints(1)[0]
+
+    def next_str(self) -> str:
+        while self.index >= len(self.tokens):
+            self.fill()
+        self.index += 1
+        if self.recording:
+            self.consumed.append(self.tokens[self.index - 1])
+        return self.tokens[self.index - 1].decode()
+
+    def take_consumed(self) -> str:
+        consumed = b" ".join(self.consumed).decode()
+        self.consumed.clear()
+        return consumed
+
+
+class TurnRecorder:
+    """
+    Writes the referee input and my actions of every turn to a gzipped JSON
+    lines replay file, that replay.py plays back offline. Enabled by pointing
+    the BOT_RECORD environment variable to the file to write.
+    """
+
+    def __init__(self, path: str, reader: ProtocolReader) -> None:
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.reader = reader
+        reader.recording = True
+
+    def record_init(self) -> None:
+        self.write({"init": self.reader.take_consumed()})
+
+    def record_turn(self, turn: int, actions: List[str]) -> None:
+        turn_input = self.reader.take_consumed()
+        self.write({"turn": turn, "input": turn_input, "output": actions})
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+Region = Tuple[int, int, int, int]
+
+
+def blip_region(
+    drone_location: Location, direction: str, habitat: Tuple[int, int]
+) -> Region:
+    """
+    Bounding box (min x, max x, min y, max y) of where a fish can be, given the
+    direction of its radar blip from a drone and its habitat depths.
+    """
+    top, bottom = habitat
+    if direction[1] == "L":
+        x_min, x_max = 0, drone_location.x
+    else:
+        x_min, x_max = drone_location.x, Consts.MAP_SIZE - 1
+    if direction[0] == "T":
+        y_min, y_max = top, max(top, min(bottom, drone_location.y))
+    else:
+        y_min, y_max = min(bottom, max(top, drone_location.y)), bottom
+    return x_min, x_max, y_min, y_max
+
+
+def intersect_regions(first: Region, second: Region) -> Optional[Region]:
+    x_min, x_max = max(first[0], second[0]), min(first[1], second[1])
+    y_min, y_max = max(first[2], second[2]), min(first[3], second[3])
+    if x_min > x_max or y_min > y_max:
+        return None
+    return x_min, x_max, y_min, y_max
+
+
+class FishLocator:
+    """
+    Bounding box of every fish I have not scanned yet. Every turn the boxes
+    grow by how far a fish can swim, then shrink to their intersection with the
+    regions the radar blips of both my drones point to. A fish in sight is
+    pinned to its exact position.
+    """
+
+    def __init__(self, fish_details: Dict[int, CreatureDetail]) -> None:
+        self.habitats: Dict[int, Tuple[int, int]] = {
+            creature_id: Consts.FISH_HABITATS[detail.type]
+            for creature_id, detail in fish_details.items()
+        }
+        self.regions: Dict[int, Region] = {}
+
+    def update(
+        self,
+        drones: List[Drone],
+        radar_blips: Dict[int, List[RadarBlip]],
+        visible_fish: List[Creature],
+    ) -> None:
+        observed: Dict[int, Region] = {}
+        for drone in drones:
+            for blip in radar_blips[drone.drone_id]:
+                habitat = self.habitats[blip.creature_id]
+                region = blip_region(drone.pos, blip.dir, habitat)
+                previous = observed.get(blip.creature_id)
+                if previous is not None:
+                    region = intersect_regions(previous, region) or region
+                observed[blip.creature_id] = region
+
+        regions: Dict[int, Region] = {}
+        for creature_id, region in observed.items():
+            known = self.regions.get(creature_id)
+            if known is not None:
+                x_min, x_max, y_min, y_max = known
+                grown = (
+                    x_min - Consts.FISH_SPEED,
+                    x_max + Consts.FISH_SPEED,
+                    y_min - Consts.FISH_SPEED,
+                    y_max + Consts.FISH_SPEED,
+                )
+                # The fish swam faster than expected when the boxes do not meet.
+                region = intersect_regions(grown, region) or region
+            regions[creature_id] = region
+        for fish in visible_fish:
+            if fish.creature_id in regions:
+                x, y = fish.pos.x, fish.pos.y
+                regions[fish.creature_id] = (x, x, y, y)
+        self.regions = regions
+
+    def estimates(self) -> Dict[int, Location]:
+        return {
+            creature_id: Location((x_min + x_max) // 2, (y_min + y_max) // 2)
+            for creature_id, (x_min, x_max, y_min, y_max) in self.regions.items()
+        }
+
+
+class Logger:
+    """
+    Diagnostics of the bot. A message under the level is dropped before its
+    arguments are formatted, the others are kept with their arguments in a ring
+    buffer and written to stderr in one go once the actions of the turn are
+    out. When given a path, flush also appends them to it as JSON lines of
+    {"turn", "level", "message"}, for the replay tooling.
+    """
+
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    OFF = 100
+    LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", OFF: "off"}
+
+    def __init__(
+        self,
+        level: int = INFO,
+        capacity: int = 256,
+        stream: Optional[TextIO] = None,
+        json_path: Optional[str] = None,
+    ) -> None:
+        self.level = level
+        self.records: deque[Tuple[int, str, Tuple[Any, ...]]] = deque(maxlen=capacity)
+        self.stream = stream
+        self.json_file = open(json_path, "a", encoding="utf-8") if json_path else None
+
+    @classmethod
+    def from_env(cls) -> Logger:
+        """
+        Level from BOT_LOG_LEVEL (debug, info, warning or off, info by default
+        and for unknown names) and JSON lines sink from BOT_LOG_JSON.
+        """
+        levels = {name: level for level, name in cls.LEVEL_NAMES.items()}
+        name = os.environ.get("BOT_LOG_LEVEL", "info")
+        log = cls(
+            levels.get(name.lower(), cls.INFO),
+            json_path=os.environ.get("BOT_LOG_JSON") or None,
+        )
+        if name.lower() not in levels:
+            log.warning("Unknown BOT_LOG_LEVEL %s, logging at info", name)
+        return log
+
+    def debug(self, message: str, *args: Any) -> None:
+        if self.DEBUG >= self.level:
+            self.records.append((self.DEBUG, message, args))
+
+    def info(self, message: str, *args: Any) -> None:
+        if self.INFO >= self.level:
+            self.records.append((self.INFO, message, args))
+
+    def warning(self, message: str, *args: Any) -> None:
+        if self.WARNING >= self.level:
+            self.records.append((self.WARNING, message, args))
+
+    def flush(self, turn: int) -> None:
+        if not self.records:
+            return
+        messages = [
+            (level, message % args if args else message)
+            for level, message, args in self.records
+        ]
+        self.records.clear()
+        stream = sys.stderr if self.stream is None else self.stream
+        stream.write("\n".join(message for _, message in messages) + "\n")
+        if self.json_file is not None:
+            self.json_file.write(
+                "".join(
+                    json.dumps(
+                        {
+                            "turn": turn,
+                            "level": self.LEVEL_NAMES[level],
+                            "message": message,
+                        }
+                    )
+                    + "\n"
+                    for level, message in messages
+                )
+            )
+            self.json_file.flush()
+
+    def close(self, turn: int) -> None:
+        self.flush(turn)
+        if self.json_file is not None:
+            self.json_file.close()
+            self.json_file = None
 
 
 def move_in_direction(current_location: Location, direction: Direction) -> Location:
@@ -166,67 +745,66 @@ def move_in_direction(current_location: Location, direction: Direction) -> Locat
         )
 
 
-def get_scans() -> List[int]:
-    scans = []
-    scan_count = int(input())
-    for _ in range(scan_count):
-        creature_id = int(input())
-        scans.append(creature_id)
-    return scans
-
-
-def get_drone_info() -> Tuple[List[Drone], Dict[int, List[RadarBlip]]]:
-    drones: List[Drone] = []
-    radar_blips: Dict[int, List[RadarBlip]] = {}
-    drone_count = int(input())
-    for _ in range(drone_count):
-        drone_id, drone_x, drone_y, dead, battery = map(int, input().split())
-        pos = Location(drone_x, drone_y)
-        drone = Drone(drone_id, pos, dead == "1", battery, [])
-        # drone_by_id[drone_id] = drone
+def get_scans(reader: ProtocolReader, scans: List[int]) -> None:
+    scans.clear()
+    scan_count = reader.next_int()
+    scans.extend(reader.next_ints(scan_count))
+
+
+def get_drone_info(
+    reader: ProtocolReader,
+    drones: List[Drone],
+    drone_by_id: Dict[int, Drone],
+    radar_blips: Dict[int, List[RadarBlip]],
+) -> None:
+    drones.clear()
+    drone_count = reader.next_int()
+    values = reader.next_ints(drone_count * 5)
+    for i in range(0, len(values), 5):
+        drone_id, drone_x, drone_y, dead, battery = values[i : i + 5]
+        drone = drone_by_id.get(drone_id)
+        if drone is None:
+            drone = Drone(drone_id, Location(drone_x, drone_y), dead == 1, battery, [])
+            drone_by_id[drone_id] = drone
+        else:
+            drone.pos.move_to(drone_x, drone_y)
+            drone.dead = dead == 1
+            drone.battery = battery
+            drone.scans.clear()
         drones.append(drone)
-        radar_blips[drone_id] = []
-
-    return drones, radar_blips
+        radar_blips.setdefault(drone_id, []).clear()
 
 
-def get_drone_by_id(
-    my_drones: List[Drone], foe_drones: List[Drone]
-) -> Dict[int, Drone]:
-    drone_by_id: Dict[int, Drone] = {}
-    for drone in my_drones + foe_drones:
-        drone_by_id[drone.drone_id] = drone
-    return drone_by_id
-
-
-def update_scans(drone_by_id: Dict[int, Drone]) -> None:
-    drone_scan_count = int(input())
-    for _ in range(drone_scan_count):
-        drone_id, creature_id = map(int, input().split())
-        drone_by_id[drone_id].scans.append(creature_id)
+def update_scans(reader: ProtocolReader, drone_by_id: Dict[int, Drone]) -> None:
+    drone_scan_count = reader.next_int()
+    values = reader.next_ints(drone_scan_count * 2)
+    for i in range(0, len(values), 2):
+        drone_by_id[values[i]].scans.append(values[i + 1])
 
 
 def get_visible_creatures(
-    fish_details: Dict[int, CreatureDetail], monster_details: Dict[int, CreatureDetail]
-) -> Tuple[List[Creature], List[Creature]]:
-    visible_fish: List[Creature] = []
-    visible_monsters: List[Creature] = []
-    visible_creature_count = int(input())
-    for _ in range(visible_creature_count):
-        creature_id, creature_x, creature_y, creature_vx, creature_vy = map(
-            int, input().split()
-        )
-        pos = Location(creature_x, creature_y)
-        speed = Location(creature_vx, creature_vy)
-        if creature_id in monster_details:
-            creature = Creature(creature_id, pos, speed, monster_details[creature_id])
+    reader: ProtocolReader,
+    creature_by_id: Dict[int, Creature],
+    visible_fish: List[Creature],
+    visible_monsters: List[Creature],
+) -> None:
+    visible_fish.clear()
+    visible_monsters.clear()
+    visible_creature_count = reader.next_int()
+    values = reader.next_ints(visible_creature_count * 5)
+    for i in range(0, len(values), 5):
+        creature_id, creature_x, creature_y, creature_vx, creature_vy = values[
+            i : i + 5
+        ]
+        creature = creature_by_id.get(creature_id)
+        if creature is None:
+            raise Exception(f"Unrecognized creature {creature_id}")
+        creature.pos.move_to(creature_x, creature_y)
+        creature.speed.move_to(creature_vx, creature_vy)
+        if creature.detail.is_monster:
             visible_monsters.append(creature)
-        elif creature_id in  fish_details:
-            creature = Creature(creature_id, pos, speed, fish_details[creature_id])
-            visible_fish.append(creature)
         else:
-            raise Exception(f"Unrecognized creature {creature}")
-    return visible_fish, visible_monsters
+            visible_fish.append(creature)
 
 
 def priorities_drone_move_direction(
@@ -248,21 +826,16 @@ def priorities_drone_move_direction(
     return move_in_direction(drone_location, best_direction)
 
 
-def initilize_input(
-    CreatureDetail,
-) -> Tuple[Dict[int, CreatureDetail], Dict[int, CreatureDetail]]:
-    fish_details: Dict[int, CreatureDetail] = {}
-    monster_details: Dict[int, CreatureDetail] = {}
+# Creature id, color and type of every creature of the initial input.
+CreatureList = Tuple[Tuple[int, int, int], ...]
 
-    creature_count = int(input())
-    for _ in range(creature_count):
-        creature_id, color, _type = map(int, input().split())
-        detail: CreatureDetail = CreatureDetail(color=color, type=_type)
-        if detail.is_monster:
-            monster_details[creature_id] = detail
-        else:
-            fish_details[creature_id] = detail
-    return fish_details, monster_details
+
+def read_creatures(reader: ProtocolReader) -> CreatureList:
+    creature_count = reader.next_int()
+    values = reader.next_ints(creature_count * 3)
+    return tuple(
+        (values[i], values[i + 1], values[i + 2]) for i in range(0, len(values), 3)
+    )
 
 
 def fish_dict_by_type(fish_details: Dict[int, CreatureDetail]) -> Dict[int, Creature]:
@@ -275,78 +848,395 @@ def fish_dict_by_type(fish_details: Dict[int, CreatureDetail]) -> Dict[int, Crea
 
 
 def fish_dict_by_color(fish_details: Dict[int, CreatureDetail]) -> Dict[int, Creature]:
-    fish_by_type = {}
+    fish_by_color = {}
     for creature_id, fish_detail in fish_details.items():
-        fish_by_type[fish_detail.color] = fish_by_type.get(fish_detail.type, []) + [
+        fish_by_color[fish_detail.color] = fish_by_color.get(fish_detail.color, []) + [
             creature_id
         ]
-    return fish_by_type
+    return fish_by_color
+
+
+class ScoreTable:
+    """
+    Achievement scoring over scan sets encoded as bitmasks: every fish gets a
+    bit once, and the color and type groups are precomputed as masks, so that
+    scoring any combination of scans is a few bitwise operations.
+    """
+
+    def __init__(self, fish_details: Dict[int, CreatureDetail]) -> None:
+        self.bit_by_fish: Dict[int, int] = {
+            creature_id: 1 << index
+            for index, creature_id in enumerate(sorted(fish_details))
+        }
+        self.color_masks: List[int] = [
+            self.mask(creature_ids)
+            for creature_ids in fish_dict_by_color(fish_details).values()
+        ]
+        self.type_masks: List[int] = [
+            self.mask(creature_ids)
+            for creature_ids in fish_dict_by_type(fish_details).values()
+        ]
+
+    def mask(self, creature_ids: List[int]) -> int:
+        mask = 0
+        for creature_id in creature_ids:
+            mask |= self.bit_by_fish.get(creature_id, 0)
+        return mask
 
+    @staticmethod
+    def completed(group_masks: List[int], mask: int) -> List[int]:
+        return [group for group in group_masks if group & mask == group]
+
+    @lru_cache(maxsize=1 << 14)
+    def achievements(self, scans: int, saved: int, foe_saved: int) -> int:
+        """
+        Achievements gained with the given scans on top of the already saved
+        ones: one point per fish the foe has not saved yet, and the color and
+        type groups completed, doubled when the foe has not completed them.
+        """
+        all_scans = scans | saved
+        amount = bin(scans & ~foe_saved).count("1")
+        for points, group_masks in (
+            (Consts.COLOR_ACHIEVEMENT_POINTS, self.color_masks),
+            (Consts.TYPE_ACHIEVEMENT_POINTS, self.type_masks),
+        ):
+            for group in self.completed(group_masks, all_scans):
+                amount += points * 2 if group & foe_saved != group else points
+        return amount
 
-fish_details, monster_details = initilize_input(CreatureDetail)
-all_fish_by_type: Dict[int, CreatureDetail] = fish_dict_by_type(fish_details)
-all_fish_by_color: Dict[int, CreatureDetail] = fish_dict_by_color(fish_details)
 
+@dataclass
+class GameSetup:
+    """
+    Everything derived from the creature list of the initial input. Built once
+    per distinct creature list by game_setup and shared by every Game playing
+    it, so its caches stay warm across games run in the same process.
+    """
 
-class Game:
-    def __init__(self) -> None:
-        self.fish_details = fish_details
-        self.all_fish_by_type = all_fish_by_type
-        self.my_score = int(input())
-        self.foe_score = int(input())
+    fish_details: Dict[int, CreatureDetail]
+    monster_details: Dict[int, CreatureDetail]
+    score_table: ScoreTable
 
-        self.my_scans = get_scans()
-        self.foe_scans = get_scans()
 
-        self.my_drones, self.my_radar_blips = get_drone_info()
-        self.foe_drones, self.foe_radar_blips = get_drone_info()
+@lru_cache(maxsize=64)
+def game_setup(creatures: CreatureList) -> GameSetup:
+    fish_details: Dict[int, CreatureDetail] = {}
+    monster_details: Dict[int, CreatureDetail] = {}
+    for creature_id, color, _type in creatures:
+        detail: CreatureDetail = CreatureDetail(color=color, type=_type)
+        if detail.is_monster:
+            monster_details[creature_id] = detail
+        else:
+            fish_details[creature_id] = detail
+    return GameSetup(fish_details, monster_details, ScoreTable(fish_details))
+
+
+def hungarian(cost: List[List[float]]) -> List[int]:
+    """
+    Minimum cost assignment of every row to a distinct column, for at most as
+    many rows as columns, with the O(rows^2 * columns) potentials method.
+    Returns the column assigned to every row.
+    """
+    rows, columns = len(cost), len(cost[0])
+    row_potential = [0.0] * (rows + 1)
+    column_potential = [0.0] * (columns + 1)
+    # Row matched to every column, 1-based, column 0 being a virtual one.
+    matched = [0] * (columns + 1)
+    way = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        matched[0] = row
+        column = 0
+        min_reduced = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            current_row = matched[column]
+            delta = math.inf
+            next_column = 0
+            for j in range(1, columns + 1):
+                if used[j]:
+                    continue
+                reduced = (
+                    cost[current_row - 1][j - 1]
+                    - row_potential[current_row]
+                    - column_potential[j]
+                )
+                if reduced < min_reduced[j]:
+                    min_reduced[j] = reduced
+                    way[j] = column
+                if min_reduced[j] < delta:
+                    delta = min_reduced[j]
+                    next_column = j
+            for j in range(columns + 1):
+                if used[j]:
+                    row_potential[matched[j]] += delta
+                    column_potential[j] -= delta
+                else:
+                    min_reduced[j] -= delta
+            column = next_column
+            if matched[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            matched[column] = matched[previous]
+            column = previous
+
+    assignment = [0] * rows
+    for column in range(1, columns + 1):
+        if matched[column]:
+            assignment[matched[column] - 1] = column - 1
+    return assignment
+
+
+SEARCH_MOVES: List[Tuple[int, int]] = [
+    (
+        round(Consts.DRONE_SPEED * math.cos(angle)),
+        round(Consts.DRONE_SPEED * math.sin(angle)),
+    )
+    for angle in np.linspace(0, 2 * math.pi, Consts.SEARCH_DIRECTIONS, endpoint=False)
+]
+
+# Drone positions, union of my unsaved scans, position after the first move of every drone.
+SearchState = Tuple[Tuple[Tuple[int, int], ...], int, Tuple[Tuple[int, int], ...]]
+
+
+class BeamSearch:
+    """
+    Plans the moves of all my drones jointly a few turns ahead. The forward
+    model moves the drones at full speed in one of SEARCH_MOVES, the monsters
+    along their last known speed, and scans the fish targets in range. Leaves
+    are scored with the achievements of the scans gathered, minus how far every
+    drone still is from its goal.
+    """
+
+    def __init__(
+        self,
+        score_table: ScoreTable,
+        saved: int,
+        foe_saved: int,
+        targets: Dict[int, Location],
+        monsters: List[TrackedMonster],
+        clock: TurnClock,
+    ) -> None:
+        self.score_table = score_table
+        self.saved = saved
+        self.foe_saved = foe_saved
+        self.clock = clock
+        self.target_by_id: Dict[int, Tuple[int, int, int]] = {
+            creature_id: (score_table.bit_by_fish[creature_id], location.x, location.y)
+            for creature_id, location in targets.items()
+        }
+        self.targets = list(self.target_by_id.values())
+        self.monster_positions: List[List[Tuple[int, int]]] = [
+            [
+                (
+                    monster.pos.x + monster.speed.x * turn,
+                    monster.pos.y + monster.speed.y * turn,
+                )
+                for monster in monsters
+            ]
+            for turn in range(1, Consts.SEARCH_DEPTH + 1)
+        ]
+        # Transposition table of single drone moves, shared by every joint state.
+        self.transitions: Dict[Tuple[int, int, int], List[Tuple[int, int, int]]] = {}
+        self.nodes = 0
 
-        self.drone_by_id: Dict[int, Drone] = get_drone_by_id(
-            self.my_drones, self.foe_drones
+    def drone_moves(self, depth: int, x: int, y: int) -> List[Tuple[int, int, int]]:
+        """
+        The moves of one drone that do not end next to a monster, as
+        (x, y, bits of the targets scanned), the position clamped to the board.
+        """
+        key = (depth, x, y)
+        moves = self.transitions.get(key)
+        if moves is not None:
+            return moves
+        danger = (Consts.MONSTER_ATTACK_RANGE + Consts.SEARCH_MONSTER_MARGIN) ** 2
+        scan_range = Consts.SCAN_RANGE**2
+        last = Consts.MAP_SIZE - 1
+        moves = []
+        for dx, dy in SEARCH_MOVES:
+            nx = max(0, min(last, x + dx))
+            ny = max(0, min(last, y + dy))
+            if any(
+                (nx - mx) ** 2 + (ny - my) ** 2 <= danger
+                for mx, my in self.monster_positions[depth]
+            ):
+                continue
+            scanned = 0
+            for bit, tx, ty in self.targets:
+                if (nx - tx) ** 2 + (ny - ty) ** 2 <= scan_range:
+                    scanned |= bit
+            moves.append((nx, ny, scanned))
+        self.transitions[key] = moves
+        return moves
+
+    def evaluate(
+        self,
+        positions: Tuple[Tuple[int, int], ...],
+        scans: int,
+        goals: List[Optional[int]],
+    ) -> float:
+        """
+        Achievements of the scans, minus the distance of every drone to its
+        goal: its assigned fish until it is scanned, then the closest fish left,
+        or the surface when its goal is None or no fish is left.
+        """
+        value = Consts.SEARCH_SCAN_WEIGHT * self.score_table.achievements(
+            scans, self.saved, self.foe_saved
         )
-        update_scans(self.drone_by_id)
+        remaining = [(tx, ty) for bit, tx, ty in self.targets if not bit & scans]
+        for (x, y), goal in zip(positions, goals):
+            target = None if goal is None else self.target_by_id[goal]
+            if target is not None and not target[0] & scans:
+                value -= math.hypot(x - target[1], y - target[2])
+            elif goal is None or not remaining:
+                value -= y
+            else:
+                value -= min(math.hypot(x - tx, y - ty) for tx, ty in remaining)
+        return value
+
+    def out_of_budget(self) -> bool:
+        return (
+            self.nodes >= Consts.SEARCH_MAX_NODES
+            or self.clock.remaining() < Consts.SEARCH_TIME_RESERVE
+        )
+
+    def plan(
+        self, drones: List[Drone], scans: int, goals: List[Optional[int]]
+    ) -> Optional[List[Location]]:
+        """
+        Return the first move of the best plan found for every drone, or None
+        when no plan keeps all the drones away from the monsters.
+        """
+        beam: List[Tuple[float, SearchState]] = [
+            (0.0, (tuple((drone.pos.x, drone.pos.y) for drone in drones), scans, ()))
+        ]
+        for depth in range(Consts.SEARCH_DEPTH):
+            children: Dict[Tuple[Any, ...], Tuple[float, SearchState]] = {}
+            for _, (positions, state_scans, first_moves) in beam:
+                options = [
+                    [(x, y, 0)] if drone.dead else self.drone_moves(depth, x, y)
+                    for drone, (x, y) in zip(drones, positions)
+                ]
+                for combination in product(*options):
+                    child_positions = tuple((x, y) for x, y, _ in combination)
+                    child_scans = state_scans
+                    for *_, scanned in combination:
+                        child_scans |= scanned
+                    key = (
+                        tuple(
+                            (x // Consts.SEARCH_GRID, y // Consts.SEARCH_GRID)
+                            for x, y in child_positions
+                        ),
+                        child_scans,
+                    )
+                    if key in children:
+                        continue
+                    self.nodes += 1
+                    children[key] = (
+                        self.evaluate(child_positions, child_scans, goals),
+                        (
+                            child_positions,
+                            child_scans,
+                            first_moves or child_positions,
+                        ),
+                    )
+                if self.out_of_budget():
+                    break
+            if not children:
+                break
+            beam = heapq.nlargest(
+                Consts.SEARCH_BEAM_WIDTH, children.values(), key=lambda child: child[0]
+            )
+            if self.out_of_budget():
+                break
+
+        _, (_, _, first_moves) = beam[0]
+        if not first_moves:
+            return None
+        return [Location(x, y) for x, y in first_moves]
+
 
-        self.visible_fish, self.visible_monsters = get_visible_creatures(
-            fish_details, monster_details
+class Game:
+    """
+    Long lived game state, updated in place from the referee input every turn.
+    """
+
+    def __init__(
+        self, reader: ProtocolReader, setup: GameSetup, out: TextIO, log: Logger
+    ) -> None:
+        self.reader = reader
+        self.out = out
+        self.log = log
+        self.fish_details = setup.fish_details
+        self.score_table = setup.score_table
+        self.turn = 0
+        self.my_score = 0
+        self.foe_score = 0
+        self.my_scans: List[int] = []
+        self.foe_scans: List[int] = []
+        self.my_scans_mask = 0
+        self.foe_scans_mask = 0
+        self.my_drones: List[Drone] = []
+        self.foe_drones: List[Drone] = []
+        self.my_radar_blips: Dict[int, List[RadarBlip]] = {}
+        self.foe_radar_blips: Dict[int, List[RadarBlip]] = {}
+        self.drone_by_id: Dict[int, Drone] = {}
+        self.creature_by_id: Dict[int, Creature] = {
+            creature_id: Creature(creature_id, Location(0, 0), Location(0, 0), detail)
+            for creature_id, detail in {
+                **setup.fish_details,
+                **setup.monster_details,
+            }.items()
+        }
+        self.visible_fish: List[Creature] = []
+        self.visible_monsters: List[Creature] = []
+        self.monster_tracker = MonsterTracker(list(setup.monster_details))
+        self.fish_locator = FishLocator(setup.fish_details)
+        self.monster_grid = SpatialGrid(Consts.MONSTER_ATTACK_RANGE)
+        self.my_unscanned_creature_ids: List[int] = []
+        self.clock = TurnClock()
+
+    def update(self) -> None:
+        reader = self.reader
+        received_at = reader.wait()
+        self.turn += 1
+        budget = Consts.FIRST_TURN_BUDGET if self.turn == 1 else Consts.TURN_BUDGET
+        self.clock.start(received_at, budget)
+        self.my_score = reader.next_int()
+        self.foe_score = reader.next_int()
+
+        get_scans(reader, self.my_scans)
+        get_scans(reader, self.foe_scans)
+        self.my_scans_mask = self.score_table.mask(self.my_scans)
+        self.foe_scans_mask = self.score_table.mask(self.foe_scans)
+
+        get_drone_info(reader, self.my_drones, self.drone_by_id, self.my_radar_blips)
+        get_drone_info(reader, self.foe_drones, self.drone_by_id, self.foe_radar_blips)
+        update_scans(reader, self.drone_by_id)
+
+        get_visible_creatures(
+            reader, self.creature_by_id, self.visible_fish, self.visible_monsters
         )
-        self.my_radar_blips = self.get_my_radar_blips(self.my_radar_blips)
-        debug(self.visible_monsters)
-
-    def all_fish_of_color_acievement_amount(self, Creature: List[int]) -> int:
-        # TODO: Check foe not already achieved.
-        all_current_scanned_fish = [*Creature, *self.my_scans]
-        cnt = 0
-        for creature_ids_by_color in all_fish_by_color.values():
-            if set(creature_ids_by_color) <= set(all_current_scanned_fish):
-                cnt += 1
-        return cnt * 3
-
-    def all_fish_of_type_acievement_amount(self, Creature: List[int]):
-        # TODO: Check foe not already achieved.
-        all_current_scanned_fish = [*Creature, *self.my_scans]
-        cnt = 0
-        for creature_ids_by_type in all_fish_by_type.values():
-            if set(creature_ids_by_type) <= set(all_current_scanned_fish):
-                cnt += 1
-        return cnt * 4
-
-    def is_first_fish_scanned(self, creature_id: int) -> int:
-        return 1 if creature_id not in self.foe_scans else 0
-
-    def get_fish_of_type_first_scanned_amount(self, Creature: List[Creature]) -> int:
-        return sum(self.is_first_fish_scanned(f) for f in Creature)
-
-    def get_achievements_amount_by_fish(self, Creature: List[Creature]) -> int:
-        return sum(
+        self.monster_tracker.update(self.turn, self.visible_monsters)
+        self.monster_grid.rebuild(
             [
-                self.all_fish_of_type_acievement_amount(Creature),
-                self.all_fish_of_color_acievement_amount(Creature),
-                self.get_fish_of_type_first_scanned_amount(Creature),
+                (monster.creature_id, monster.pos.x, monster.pos.y)
+                for monster in self.monster_tracker.known_monsters()
             ]
         )
+        self.my_unscanned_creature_ids = self.get_my_unscanned_creature_ids()
+        self.get_my_radar_blips(self.my_radar_blips)
+        self.fish_locator.update(self.my_drones, self.my_radar_blips, self.visible_fish)
+        self.clock.record("parse", time.perf_counter() - self.clock.started)
+        self.log.debug("Visible monsters: %s", self.visible_monsters)
+
+    def get_achievements_amount_by_mask(self, scans: int) -> int:
+        return self.score_table.achievements(
+            scans, self.my_scans_mask, self.foe_scans_mask
+        )
 
-    @cached_property
-    def my_unscanned_creature_ids(self) -> List[int]:
+    def get_my_unscanned_creature_ids(self) -> List[int]:
         final_target_fish = [
             creature_id
             for creature_id in self.fish_details.keys()
@@ -362,20 +1252,19 @@ class Game:
         # TODO: Make sure that if 2 drones add same acievements only q goes up.
         #
         drones_to_base = []
-        base_acievemnts = self.get_achievements_amount_by_fish([])
+        base_acievemnts = self.get_achievements_amount_by_mask(0)
         max_achievements = base_acievemnts
+        all_drones_mask = 0
         for drone in self.my_drones:
-            drone_achivements = self.get_achievements_amount_by_fish(drone.scans)
+            drone_mask = self.score_table.mask(drone.scans)
+            all_drones_mask |= drone_mask
+            drone_achivements = self.get_achievements_amount_by_mask(drone_mask)
             if drone_achivements > base_acievemnts + 5:
                 drones_to_base.append(drone)
             if max_achievements < drone_achivements:
                 max_achievements = drone_achivements
 
-        all_drone_achievements = self.get_achievements_amount_by_fish(
-            list(
-                set([Creature for drone in self.my_drones for Creature in drone.scans])
-            )
-        )
+        all_drone_achievements = self.get_achievements_amount_by_mask(all_drones_mask)
         if (
             all_drone_achievements > max_achievements
             and all_drone_achievements - max_achievements > 5
@@ -384,68 +1273,235 @@ class Game:
         else:
             return drones_to_base
 
-    def get_my_radar_blips(
-        self, my_radar_blips: Dict[int, List[RadarBlip]]
-    ) -> Dict[int, List[RadarBlip]]:
-        my_radar_blip_count = int(input())
+    def get_my_radar_blips(self, my_radar_blips: Dict[int, List[RadarBlip]]) -> None:
+        my_radar_blip_count = self.reader.next_int()
         for _ in range(my_radar_blip_count):
-            drone_id, creature_id, dir = input().split()
+            drone_id, creature_id = self.reader.next_ints(2)
+            dir = self.reader.next_str()
             # Ignore monsters
-            if int(creature_id) in self.fish_details:
-                if int(creature_id) in self.my_unscanned_creature_ids:
-                    drone_id = int(drone_id)
-                    creature_id = int(creature_id)
+            if creature_id in self.fish_details:
+                if creature_id in self.my_unscanned_creature_ids:
                     my_radar_blips[drone_id].append(RadarBlip(creature_id, dir))
-        return my_radar_blips
-    
+
     def find_safe_dest(self, drone: Drone, dest: Location) -> Location:
         """
         Return a location who is safe - e.g. no monsters in attack range, and
         is as close the given destination as possible
         """
-        debug(f"Dest : {dest}")
+        self.log.debug("Dest: %s", dest)
         next_turn_loc = drone.pos.towards(dest, speed=Consts.DRONE_SPEED)
-        debug(f"Towards: {next_turn_loc}")
-        monsters_locations = [
-            monster.pos.add(monster.speed) for monster in self.visible_monsters
-        ]
-        if not next_turn_loc.is_location_in_range_of_locations(locations=monsters_locations, _range=Consts.MONSTER_ATTACK_RANGE):
+        self.log.debug("Towards: %s", next_turn_loc)
+        # Only monsters this close to the move can come in range during the turn.
+        reach = Consts.MONSTER_ATTACK_RANGE + Consts.MONSTER_MAX_SPEED
+        threats = self.monster_grid.near_segment(drone.pos, next_turn_loc, reach)
+        if not threats:
+            return dest
+        monsters, speeds = self.monster_arrays(threats)
+        end = np.array([(next_turn_loc.x, next_turn_loc.y)], dtype=np.int64)
+        range_squared = Consts.MONSTER_ATTACK_RANGE**2
+        if closest_approach(drone.pos, end, monsters, speeds).min() > range_squared:
             return dest
-        
-        best_location = drone.pos
-        best_distance = sys.maxsize
-        debug(f"Monstres: {monsters_locations}")
-        for location in drone.pos.generate_circle_locations():
-            debug(f"Circle option: {location}")
-            if not location.is_location_in_range_of_locations(monsters_locations, _range=Consts.MONSTER_ATTACK_RANGE):
-                distance = location.distance(dest)
-                if location.distance(dest) < best_distance:
-                    best_distance = distance
-                    best_location = location
-
-        return best_location
-
-        
-
-    def run_turn(self) -> None:
-        should_go_to_base = self.get_drones_that_should_go_to_base()
-        for drone in self.my_drones:
-            loc = priorities_drone_move_direction(
-                drone_location=drone.pos,
-                radar_blips=self.my_radar_blips[drone.drone_id],
-            )
-            light = 1 if drone.battery >= 5 and game_turn % 2 == 0 else 0
-            # if len(drone.scans) > 1 or len(self.my_radar_blips[drone.drone_id]) == 0:
-            if drone in should_go_to_base:
-                loc = Location(drone.pos.x, 0)
 
-            loc = self.find_safe_dest(drone, loc)
+        nearby = self.monster_grid.within(
+            drone.pos.x, drone.pos.y, max(Consts.SAFE_DEST_RADII) + reach
+        )
+        self.log.debug("Monsters: %s", nearby)
+        monsters, speeds = self.monster_arrays(nearby)
+        return pick_safe_candidate(
+            drone.pos,
+            dest,
+            monsters,
+            speeds,
+            _range=Consts.MONSTER_ATTACK_RANGE,
+            clock=self.clock,
+        )
 
-            print(f"MOVE {loc.x} {loc.y} {light}")
+    def monster_arrays(self, items: List[GridItem]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Positions and speeds of the monster grid items, as (m, 2) arrays.
+        """
+        monsters = self.monster_tracker.monsters
+        positions = np.array([(x, y) for _, x, y in items], dtype=np.int64)
+        speeds = np.array(
+            [
+                (monsters[creature_id].speed.x, monsters[creature_id].speed.y)
+                for creature_id, _, _ in items
+            ],
+            dtype=np.int64,
+        )
+        return positions, speeds
 
+    def fish_targets(self) -> Dict[int, Location]:
+        """
+        Estimated locations of the fish none of my drones has scanned yet.
+        """
+        return self.fish_locator.estimates()
 
-game_turn = 1
-while True:
-    game = Game()
-    game.run_turn()
-    game_turn += 1
+    def assign_targets(
+        self, targets: Dict[int, Location], scans: int, should_go_to_base: List[Drone]
+    ) -> List[Optional[int]]:
+        """
+        Assign every drone a distinct fish target, or the surface (None), by
+        solving the drone x (fish + surface) cost matrix. A fish costs the
+        distance to it minus the achievements it adds, the surface is reserved
+        to the drones that should go to base, and the fallback of the others
+        when there are not enough fish left.
+        """
+        fish_ids = list(targets)
+        drones = self.my_drones
+        fish_positions = np.array(
+            [(targets[fish_id].x, targets[fish_id].y) for fish_id in fish_ids],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        drone_positions = np.array(
+            [(drone.pos.x, drone.pos.y) for drone in drones], dtype=np.float64
+        )
+        offsets = drone_positions[:, None, :] - fish_positions[None, :, :]
+        distances = np.hypot(offsets[:, :, 0], offsets[:, :, 1])
+
+        base_achievements = self.get_achievements_amount_by_mask(scans)
+        fish_values = np.array(
+            [
+                self.get_achievements_amount_by_mask(
+                    scans | self.score_table.bit_by_fish[creature_id]
+                )
+                - base_achievements
+                for creature_id in fish_ids
+            ],
+            dtype=np.float64,
+        )
+        fish_costs = distances - Consts.ASSIGNMENT_SCAN_WEIGHT * fish_values
+
+        cost = np.full(
+            (len(drones), len(fish_ids) + len(drones)), Consts.FORBIDDEN_COST
+        )
+        for index, drone in enumerate(drones):
+            if drone.dead or drone in should_go_to_base:
+                cost[index, len(fish_ids) + index] = 0
+            else:
+                cost[index, : len(fish_ids)] = fish_costs[index]
+                cost[index, len(fish_ids) + index] = Consts.FORBIDDEN_COST / 2
+        assignment = hungarian(cost.tolist())
+        return [
+            fish_ids[column] if column < len(fish_ids) else None
+            for column in assignment
+        ]
+
+    def plan_moves(
+        self, targets: Dict[int, Location], scans: int, goals: List[Optional[int]]
+    ) -> Optional[List[Location]]:
+        if not targets:
+            return None
+        search = BeamSearch(
+            self.score_table,
+            self.my_scans_mask,
+            self.foe_scans_mask,
+            targets,
+            self.monster_tracker.known_monsters(),
+            self.clock,
+        )
+        return search.plan(self.my_drones, scans, goals)
+
+    def run_turn(self) -> List[str]:
+        actions: List[str] = []
+        with self.clock.phase("scoring"):
+            should_go_to_base = self.get_drones_that_should_go_to_base()
+        targets = self.fish_targets()
+        scans = self.score_table.mask(
+            [creature_id for drone in self.my_drones for creature_id in drone.scans]
+        )
+        with self.clock.phase("assignment"):
+            goals = self.assign_targets(targets, scans, should_go_to_base)
+        with self.clock.phase("search"):
+            plan = self.plan_moves(targets, scans, goals)
+        for index, drone in enumerate(self.my_drones):
+            goal = goals[index]
+            if plan is not None:
+                loc = plan[index]
+            elif goal is not None:
+                loc = targets[goal]
+            else:
+                loc = priorities_drone_move_direction(
+                    drone_location=drone.pos,
+                    radar_blips=self.my_radar_blips[drone.drone_id],
+                )
+            light = 1 if drone.battery >= 5 and self.turn % 2 == 0 else 0
+            # if len(drone.scans) > 1 or len(self.my_radar_blips[drone.drone_id]) == 0:
+            if plan is None and drone in should_go_to_base:
+                loc = Location(drone.pos.x, 0)
+
+            with self.clock.phase("safety"):
+                loc = self.find_safe_dest(drone, loc)
+
+            actions.append(f"MOVE {loc.x} {loc.y} {light}")
+
+        with self.clock.phase("output"):
+            self.out.write("\n".join(actions) + "\n")
+            self.out.flush()
+        self.clock.end_turn()
+        return actions
+
+
+class Bot:
+    """
+    The bot over any input and output stream: reads the initial input, then
+    plays a turn per call of play_turn. Harnesses can run as many bots as they
+    like in one process, the __main__ shim runs one over stdin and stdout.
+    """
+
+    def __init__(self, game: Game, recorder: Optional[TurnRecorder] = None) -> None:
+        self.game = game
+        self.recorder = recorder
+
+    @classmethod
+    def from_stream(
+        cls,
+        stream: BinaryIO,
+        out: Optional[TextIO] = None,
+        record_path: Optional[str] = None,
+        log: Optional[Logger] = None,
+    ) -> Bot:
+        reader = ProtocolReader(stream)
+        recorder = None
+        if record_path:
+            recorder = TurnRecorder(record_path, reader)
+        creatures = read_creatures(reader)
+        if recorder is not None:
+            recorder.record_init()
+        started = time.perf_counter()
+        setup = game_setup(creatures)
+        game = Game(
+            reader,
+            setup,
+            sys.stdout if out is None else out,
+            Logger.from_env() if log is None else log,
+        )
+        game.clock.record("setup", time.perf_counter() - started)
+        return cls(game, recorder)
+
+    def play_turn(self) -> List[str]:
+        self.game.update()
+        actions = self.game.run_turn()
+        if self.recorder is not None:
+            self.recorder.record_turn(self.game.turn, actions)
+        self.game.log.flush(self.game.turn)
+        return actions
+
+    def run(self) -> None:
+        try:
+            while self.game.turn < Consts.MAX_TURNS:
+                self.play_turn()
+        except EOFError:
+            pass  # The referee ended the game before the last turn
+        finally:
+            self.game.log.info("%s", self.game.clock.report())
+            self.close()
+
+    def close(self) -> None:
+        self.game.log.close(self.game.turn)
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+if __name__ == "__main__":
+    Bot.from_stream(sys.stdin.buffer, record_path=os.environ.get("BOT_RECORD")).run()
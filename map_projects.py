@@ -3,122 +3,761 @@
 import asyncio
 import os
 import csv
+import json
 import logging  # Import the logging module
+import random
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import cycle
+import google.auth
+from google.api_core import exceptions as api_exceptions
 from google.cloud import resourcemanager_v3
 from google.cloud import billing_v1  # Import Billing API client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def get_project_billing_account_name(project_id):
-    """Fetches the billing account name for a given project ID."""
-    billing_client = billing_v1.CloudBillingClient()
+# Maximum number of RPCs in flight at once
+MAX_IN_FLIGHT_REQUESTS = int(os.environ.get("MAX_IN_FLIGHT_REQUESTS", "32"))
+
+# gRPC channels opened per API, and how often they ping the server when idle
+GRPC_CHANNEL_POOL_SIZE = int(os.environ.get("GRPC_CHANNEL_POOL_SIZE", "4"))
+GRPC_KEEPALIVE_MS = int(os.environ.get("GRPC_KEEPALIVE_MS", "30000"))
+
+
+class ClientRegistry:
+    """The Google Cloud clients of a run, created once and shared by every task. Each API
+    gets a pool of clients with a gRPC channel of their own, handed out round robin, since
+    one channel caps its concurrent streams. Credentials are resolved once for all of them.
+    Clients passed in, e.g. local fakes, are used instead of creating any."""
+
+    def __init__(self, folders_client=None, projects_client=None, billing_client=None,
+                 pool_size=GRPC_CHANNEL_POOL_SIZE, keepalive_ms=GRPC_KEEPALIVE_MS):
+        self.pool_size = pool_size
+        self.keepalive_ms = keepalive_ms
+        self.credentials = None
+        self.owned_clients = [] # Clients created here, closed by close()
+        self.folders_pool = self.client_pool(folders_client, resourcemanager_v3.FoldersClient)
+        self.projects_pool = self.client_pool(projects_client, resourcemanager_v3.ProjectsClient)
+        self.billing_pool = self.client_pool(billing_client, billing_v1.CloudBillingClient)
+
+    def client_pool(self, client, client_class):
+        if client is not None:
+            return cycle([client])
+        if self.credentials is None:
+            self.credentials, _ = google.auth.default()
+        clients = [self.create_client(client_class) for _ in range(self.pool_size)]
+        self.owned_clients.extend(clients)
+        return cycle(clients)
+
+    def create_client(self, client_class):
+        transport_class = client_class.get_transport_class("grpc")
+        transport = transport_class(
+            credentials=self.credentials,
+            channel=partial(self.create_channel, transport_class),
+        )
+        return client_class(transport=transport)
+
+    def create_channel(self, transport_class, host, **kwargs):
+        """Creates the channel of a transport, with keepalive on top of its own options."""
+        kwargs["options"] = [
+            *kwargs.get("options", []),
+            ("grpc.keepalive_time_ms", self.keepalive_ms),
+            ("grpc.keepalive_timeout_ms", 10000),
+            ("grpc.keepalive_permit_without_calls", 1),
+        ]
+        return transport_class.create_channel(host, **kwargs)
+
+    def folders(self):
+        return next(self.folders_pool)
+
+    def projects(self):
+        return next(self.projects_pool)
+
+    def billing(self):
+        return next(self.billing_pool)
+
+    def close(self):
+        for client in self.owned_clients:
+            client.transport.close()
+
+
+# Requests per second sent to each API, set them to the quotas of the calling project
+API_RATE_LIMITS = {
+    "resourcemanager": float(os.environ.get("RESOURCE_MANAGER_QPS", "10")),
+    "billing": float(os.environ.get("BILLING_QPS", "5")),
+}
+
+# Retries of a call failing with a transient error, and the bounds of the backoff in seconds
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "6"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "32"))
+
+# Deadline of a single RPC in seconds. The clients' own retries are turned off (retry=None)
+# on every call, so that each attempt goes through the rate limits and metrics of RpcSession.
+RPC_TIMEOUT = float(os.environ.get("RPC_TIMEOUT", "60"))
+
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted, # Quota exceeded
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.Aborted,
+)
+
+
+class TokenBucket:
+    """Lets through rate calls per second on average, and bursts of up to burst calls.
+    Only used from the event loop thread."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ApiMetrics:
+    """Calls, retries, failures and latencies of the calls to one API."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0 # Calls given up on, after their retries
+        self.latencies = []
+        self.started = None
+        self.finished = None
+
+    def record(self, started, finished):
+        self.calls += 1
+        self.latencies.append(finished - started)
+        self.started = started if self.started is None else min(self.started, started)
+        self.finished = finished if self.finished is None else max(self.finished, finished)
+
+    def percentile(self, fraction):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+    def report(self, api):
+        duration = (self.finished - self.started) if self.calls else 0.0
+        throughput = self.calls / duration if duration > 0 else 0.0
+        return (
+            f"{api}: {self.calls} calls, {self.retries} retries, {self.failures} failures, "
+            f"latency p50 {self.percentile(0.5) * 1000:.0f}ms p99 {self.percentile(0.99) * 1000:.0f}ms, "
+            f"{throughput:.1f} calls/s"
+        )
+
+
+class RpcSession:
+    """Schedules every blocking Google Cloud client call of the crawl. A call waits for a
+    token of its API's rate limit, runs in a bounded thread pool so that the coroutines
+    of the crawl really overlap instead of blocking the event loop, and is retried with
+    exponential backoff and full jitter when it fails with a transient error. The clients
+    of the calls come from its registry, one for the whole run by default."""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT_REQUESTS, clients=None, rate_limits=None):
+        self.clients = clients if clients is not None else ClientRegistry()
+        self.billing_index = None # Task building the project ID -> billing account index, if any
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="rpc")
+        self.semaphore = asyncio.Semaphore(max_in_flight)  # Queue the calls here, not in the executor
+        rate_limits = API_RATE_LIMITS if rate_limits is None else rate_limits
+        self.buckets = {api: TokenBucket(rate) for api, rate in rate_limits.items()}
+        self.metrics = {api: ApiMetrics() for api in rate_limits}
+
+    async def call(self, api, func, *args, **kwargs):
+        """Awaits func(*args, **kwargs), a call to the given API, run on a worker thread."""
+        metrics = self.metrics[api]
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_RETRIES + 1):
+            await self.buckets[api].acquire()
+            async with self.semaphore:
+                started = time.perf_counter()
+                try:
+                    return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+                except RETRYABLE_ERRORS as e:
+                    if attempt == MAX_RETRIES:
+                        metrics.failures += 1
+                        raise
+                    error = e
+                except Exception:
+                    metrics.failures += 1
+                    raise
+                finally:
+                    metrics.record(started, time.perf_counter())
+            metrics.retries += 1
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)) # Full jitter
+            logging.debug(f"Retrying {func.__name__} in {delay:.1f}s after: {error}") # Debug log
+            await asyncio.sleep(delay)
+
+    async def call_pages(self, api, func, *args):
+        """Awaits every page of a listing, func(*args, page_token=...) fetching a single page and
+        returning its items and the next page token. Each page is a call of its own, so it waits
+        for a token of the rate limit, is recorded in the metrics, and is retried alone."""
+        items = []
+        page_token = ""
+        while True:
+            page, page_token = await self.call(api, func, *args, page_token=page_token)
+            items.extend(page)
+            if not page_token:
+                return items
+
+    def report(self):
+        """Logs the metrics of every API called."""
+        for api, metrics in self.metrics.items():
+            if metrics.calls:
+                logging.info(metrics.report(api)) # Info log
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.clients.close()
+
+
+def get_project_billing_account_name(project_id, clients):
+    """Fetches the billing account name for a given project ID (blocking)."""
+    billing_client = clients.billing()
     project_name = f"projects/{project_id}"
+    project_billing_info = billing_client.get_project_billing_info(name=project_name, retry=None, timeout=RPC_TIMEOUT)
+    return project_billing_info.billing_account_name
+
+
+BILLING_NOT_FOUND = "Billing Account Not Found"
+BILLING_LOOKUP_FAILED = "Billing Lookup Failed" # Still failing after every retry
+
+# How billing accounts are resolved: "project" for a lookup per project, "account" to list
+# the projects of every billing account once and look up per project only the misses
+BILLING_LOOKUP = os.environ.get("BILLING_LOOKUP", "project")
+
+
+# The listing functions below fetch a single page (blocking, one RPC) and return its items and
+# the token of the next page, empty on the last one. They only read the first response of the
+# pager a client returns, iterating it would fetch the next pages outside of the RpcSession.
+
+def list_billing_account_names(clients, page_token=""):
+    """Lists a page of the billing accounts the caller can see."""
+    request = billing_v1.ListBillingAccountsRequest(page_size=100, page_token=page_token)
+    response = clients.billing().list_billing_accounts(request=request, retry=None, timeout=RPC_TIMEOUT)
+    return [account.name for account in response.billing_accounts], response.next_page_token
+
+
+def list_billing_account_projects(billing_account_name, clients, page_token=""):
+    """Lists a page of the (project ID, billing account name) of the projects linked to a billing account."""
+    request = billing_v1.ListProjectBillingInfoRequest(
+        name=billing_account_name, page_size=100, page_token=page_token # Largest page allowed
+    )
+    response = clients.billing().list_project_billing_info(request=request, retry=None, timeout=RPC_TIMEOUT)
+    return [(info.project_id, info.billing_account_name) for info in response.project_billing_info], response.next_page_token
+
+
+async def build_billing_index(session):
+    """Builds the project ID -> billing account name index from the billing accounts, a
+    listing per account, all accounts at once. An account that fails to list is left out,
+    its projects fall back to the per project lookup."""
+    billing_account_names = await session.call_pages("billing", list_billing_account_names, session.clients)
+    listings = await asyncio.gather(
+        *[session.call_pages("billing", list_billing_account_projects, name, session.clients) for name in billing_account_names],
+        return_exceptions=True,
+    )
+    billing_index = {}
+    for billing_account_name, listing in zip(billing_account_names, listings):
+        if isinstance(listing, Exception):
+            logging.warning(f"Billing Account: {billing_account_name} - Projects not listed: {listing}") # Warning log
+            continue
+        billing_index.update(listing)
+    logging.info(f"Indexed {len(billing_index)} projects of {len(billing_account_names)} billing accounts") # Info log
+    return billing_index
+
+
+async def lookup_billing_account_name(project_id, session):
+    """The billing account of a project, from the billing index when there is one."""
+    if session.billing_index is not None:
+        try:
+            billing_index = await session.billing_index
+        except Exception as e:
+            logging.warning(f"Billing index not available, looking up every project: {e}") # Warning log
+            session.billing_index = None
+        else:
+            if project_id in billing_index:
+                return billing_index[project_id]
     try:
-        project_billing_info = billing_client.get_project_billing_info(name=project_name) # Async call
-        billing_account_name = project_billing_info.billing_account_name
+        billing_account_name = await session.call("billing", get_project_billing_account_name, project_id, session.clients)
         logging.debug(f"Project ID: {project_id} - Billing Account Name fetched: {billing_account_name}") # Debug log
         return billing_account_name
+    except (api_exceptions.NotFound, api_exceptions.PermissionDenied) as e:
+        logging.warning(f"Project ID: {project_id} - Billing Account Not Found: {e}") # Warning log
+        return BILLING_NOT_FOUND # Handle cases where billing info isn't accessible
     except Exception as e:
-        logging.warning(f"Project ID: {project_id} - Billing Account Not Found or Error: {e}") # Warning log
-        return "Billing Account Not Found" # Handle cases where billing info isn't accessible
+        logging.error(f"Project ID: {project_id} - Billing Lookup Failed: {e}") # Error log
+        return BILLING_LOOKUP_FAILED
 
-async def fetch_project_details(project, session): # session is not used directly in this example but is good practice for aiohttp
-    """Fetches project details including billing account and labels."""
+
+async def fetch_project_details(project, session, cache=None, folder_name=None): # session runs the blocking RPCs
+    """Fetches project details including billing account and labels, from the cache when
+    it holds an unchanged copy of the project."""
+    if cache is not None:
+        cached = cache.lookup(project, folder_name)
+        if cached is not None:
+            return cached
     project_id = project.project_id
     project_display_name = project.display_name if project.display_name else project.project_id # Use project ID as fallback
-    labels = project.labels if project.labels else {}
+    labels = dict(project.labels) if project.labels else {}
     logging.debug(f"Fetching details for Project ID: {project_id}, Display Name: {project_display_name}") # Debug log
-    billing_account_name = get_project_billing_account_name(project_id) # Async call
+    billing_account_name = await lookup_billing_account_name(project_id, session)
 
-    return {
+    project_detail = {
         "Project Display Name": project_display_name,
         "Project ID": project_id,
         "Billing Account ID Name": billing_account_name,
         "Labels": labels
     }
+    if cache is not None:
+        cache.store(project, project_detail, folder_name)
+    return project_detail
+
+def list_projects(parent, clients, page_token=""):
+    """Lists a page of the projects directly under a folder or organization."""
+    project_client = clients.projects()
+    project_request = resourcemanager_v3.ListProjectsRequest(parent=parent, page_token=page_token)
+    response = project_client.list_projects(request=project_request, retry=None, timeout=RPC_TIMEOUT)
+    return list(response.projects), response.next_page_token
+
+
+def list_folder_names(parent, clients, page_token=""):
+    """Lists a page of the resource names of the folders directly under a folder or organization."""
+    folder_client = clients.folders()
+    folder_request = resourcemanager_v3.ListFoldersRequest(parent=parent, page_token=page_token)
+    response = folder_client.list_folders(request=folder_request, retry=None, timeout=RPC_TIMEOUT)
+    return [folder.name for folder in response.folders], response.next_page_token
 
-async def list_projects_in_folder(folder_name, level, session, project_details_list):
-    """Asynchronously lists projects in a folder and its subfolders recursively."""
-    folder_client = resourcemanager_v3.FoldersClient()
-    project_client = resourcemanager_v3.ProjectsClient()
+
+async def list_projects_in_folder(folder_name, level, session, writer, cache=None):
+    """Asynchronously lists the projects directly in a folder and fetches their details.
+    Returns whether every project of the folder was written."""
     indent = "  " * level
     folder_id_numeric = folder_name.split('/')[-1] # Extract numeric folder ID
 
-    logging.info(f"{indent}Processing Folder: {folder_id_numeric} - Resource Name: {folder_name}") # Info log
+    try:
+        projects = await session.call_pages("resourcemanager", list_projects, folder_name, session.clients)
+    except Exception as e:
+        logging.error(f"{indent}Error listing projects in folder '{folder_name}': {e}") # Error log
+        return False
+    logging.info(f"{indent}  Found {len(projects)} projects in folder: {folder_id_numeric}") # Info log
 
+    # Fetch project details concurrently, writing each one out as soon as it is resolved.
+    # Writer errors are not the folder's fault, they propagate and stop the crawl.
+    tasks = [asyncio.ensure_future(fetch_project_details(project, session, cache, folder_name)) for project in projects]
     try:
-        project_request = resourcemanager_v3.ListProjectsRequest(
-            parent=folder_name
-        )
-        page_result_projects = project_client.list_projects(request=project_request)
-        projects = list(page_result_projects) # Convert iterator to list for concurrent processing
-        logging.info(f"{indent}  Found {len(projects)} projects in folder: {folder_id_numeric}") # Info log
+        for task in asyncio.as_completed(tasks):
+            writer.write(await task)
+    finally:
+        for task in tasks:
+            task.cancel() # Only the unfinished ones, when writing failed or the crawl is cancelled
+    return True
 
-        # Fetch project details concurrently
-        tasks = [fetch_project_details(project, session) for project in projects] # Pass session if using aiohttp
-        project_details_results = await asyncio.gather(*tasks) # Await all tasks to complete
-        project_details_list.extend(project_details_results) # Add results to the main list
 
-        folder_request = resourcemanager_v3.ListFoldersRequest(
-            parent=folder_name
-        )
-        page_result_folders = folder_client.list_folders(request=folder_request)
+# Number of folders processed at once by the crawl
+CRAWL_WORKERS = int(os.environ.get("CRAWL_WORKERS", "16"))
 
-        for folder in page_result_folders:
-            await list_projects_in_folder(folder.name, level + 1, session, project_details_list) # Recursive async call
 
-    except Exception as e:
-        logging.error(f"{indent}Error processing folder '{folder_name}': {e}") # Error log
+class FolderCrawler:
+    """Walks the folder tree breadth first with a pool of workers sharing a queue of
+    folders. A worker queues the subfolders of its folder as soon as they are listed,
+    before fetching its projects, so that every level of the tree is in flight at once."""
+
+    def __init__(self, session, writer, cache=None, workers=CRAWL_WORKERS):
+        self.session = session
+        self.writer = writer
+        self.cache = cache
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self.visited = set() # Folder resource names already queued
+        self.failed_folders = [] # Folders some projects or subfolders of could not be listed
 
+    def enqueue(self, folder_name, level):
+        if folder_name not in self.visited:
+            self.visited.add(folder_name)
+            self.queue.put_nowait((folder_name, level))
 
-async def get_all_projects_async(organization_id):
-    """Asynchronously retrieves all projects in the organization and its folders."""
-    project_client = resourcemanager_v3.ProjectsClient()
-    project_details_list = [] # List to store dictionaries of project details
+    async def crawl(self, root_name):
+        """Crawls every folder under root_name, root_name itself at level 0. Errors listing a
+        folder only mark it as failed, any other error escaping a worker stops the crawl and
+        is raised here."""
+        self.enqueue(root_name, 0)
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        joined = asyncio.create_task(self.queue.join()) # Every queued folder is done
+        try:
+            done, _ = await asyncio.wait([joined, *workers], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not joined:
+                    task.result() # A worker only returns by failing, e.g. on a cache or writer error
+        finally:
+            joined.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(joined, *workers, return_exceptions=True)
+
+    async def worker(self):
+        while True:
+            folder_name, level = await self.queue.get()
+            try:
+                await self.process_folder(folder_name, level)
+            finally:
+                self.queue.task_done()
+
+    async def process_folder(self, folder_name, level):
+        indent = "  " * level
+        folder_id_numeric = folder_name.split('/')[-1] # Extract numeric folder ID
+        if self.cache is not None and self.cache.is_folder_done(folder_name):
+            # Completed by the interrupted run this one resumes
+            logging.info(f"{indent}Processing Folder: {folder_id_numeric} - Resumed from cache") # Info log
+            for project_detail in self.cache.folder_projects(folder_name):
+                self.writer.write(project_detail)
+            for child_name in self.cache.folder_children(folder_name):
+                self.enqueue(child_name, level + 1)
+            return
+        logging.info(f"{indent}Processing Folder: {folder_id_numeric} - Resource Name: {folder_name}") # Info log
+
+        projects_task = asyncio.create_task(
+            list_projects_in_folder(folder_name, level, self.session, self.writer, self.cache)
+        )
+        child_names = None
+        try:
+            try:
+                child_names = await self.session.call_pages("resourcemanager", list_folder_names, folder_name, self.session.clients)
+                for child_name in child_names:
+                    self.enqueue(child_name, level + 1)
+            except Exception as e:
+                logging.error(f"{indent}Error listing subfolders of folder '{folder_name}': {e}") # Error log
+            projects_done = await projects_task
+        finally:
+            projects_task.cancel() # Only does anything when the crawl itself is cancelled
+        if not projects_done or child_names is None:
+            self.failed_folders.append(folder_name)
+        elif self.cache is not None:
+            self.cache.mark_folder_done(folder_name, child_names)
+
+
+async def get_all_projects_async(organization_id, session, writer, cache=None, billing_lookup=BILLING_LOOKUP):
+    """Asynchronously retrieves all projects in the organization and its folders, and
+    hands each one to the writer as soon as its details are fetched."""
     logging.info(f"Starting to fetch projects for organization: {organization_id}") # Info log
 
-    # Get projects directly under organization (optional - based on previous findings)
-    logging.info("Fetching projects directly under organization...") # Info log
-    org_request = resourcemanager_v3.ListProjectsRequest(
-        parent=f"organizations/{organization_id}"
-    )
-    page_result_org_projects = project_client.list_projects(request=org_request)
-    org_projects = list(page_result_org_projects)
-    logging.info(f"Found {len(org_projects)} projects directly under organization.") # Info log
-    org_tasks = [fetch_project_details(project, None) for project in org_projects] # No session needed for google-cloud-client
-    org_project_details_results = await asyncio.gather(*org_tasks)
-    project_details_list.extend(org_project_details_results)
+    if billing_lookup == "account":
+        # Built while the crawl starts listing folders, the first billing lookup awaits it
+        session.billing_index = asyncio.create_task(build_billing_index(session))
 
+    # The organization is the root of the crawl, its own projects are listed like a folder's
+    crawler = FolderCrawler(session, writer, cache)
+    await crawler.crawl(f"organizations/{organization_id}")
+    if crawler.failed_folders:
+        # Left unfinished in the cache, so that RESUME=1 retries only these folders
+        logging.error(
+            f"{len(crawler.failed_folders)} folders not crawled completely: {', '.join(crawler.failed_folders)}"
+        ) # Error log
+    elif cache is not None:
+        cache.finish_run()
 
-    # Get projects recursively from folders
-    logging.info("Fetching projects recursively from folders...") # Info log
-    folder_client = resourcemanager_v3.FoldersClient()
-    org_resource_name = f"organizations/{organization_id}"
-    folder_request = resourcemanager_v3.ListFoldersRequest(parent=org_resource_name)
-    page_result_top_level_folders = folder_client.list_folders(request=folder_request)
+    logging.info(f"Completed fetching projects from {len(crawler.visited) - 1} folders.") # Info log
 
-    top_level_folders = list(page_result_top_level_folders) # Convert iterator to list for folder processing
-    folder_tasks = [list_projects_in_folder(folder.name, 1, None, project_details_list) for folder in top_level_folders] # No session needed for google-cloud-client
-    await asyncio.gather(*folder_tasks) # Run folder processing tasks concurrently
 
-    logging.info("Completed fetching projects from folders.") # Info log
-    return project_details_list
+# Output format (csv, jsonl or parquet), file, and projects written per flush
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "csv")
+OUTPUT_FILE = os.environ.get("OUTPUT_FILE")
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "500"))
 
+PROJECT_COLUMNS = ["Project Display Name", "Project ID", "Billing Account ID Name", "Labels"]
 
-def write_projects_to_csv(project_details_list, csv_filename="projects_output.csv"):
-    """Writes project details to a CSV file."""
-    csv_columns = ["Project Display Name", "Project ID", "Billing Account ID Name", "Labels"]
-    try:
-        logging.info(f"Writing project details to CSV file: {csv_filename}") # Info log
-        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=csv_columns)
-            writer.writeheader()
-            for project_detail in project_details_list:
-                writer.writerow(project_detail)
-        logging.info(f"Project details written to: {csv_filename}") # Info log
-    except Exception as e:
-        logging.error(f"Error writing to CSV file: {e}") # Error log
+
+class ProjectWriter(ABC):
+    """Streams project details to an output file as the crawl resolves them. Projects are
+    buffered and written a batch at a time, so memory does not grow with the org size and
+    a crash only loses the last batch."""
+
+    extension = None
+
+    def __init__(self, filename=None, batch_size=WRITE_BATCH_SIZE):
+        self.filename = filename or f"projects_output.{self.extension}"
+        self.batch_size = batch_size
+        self.batch = []
+        self.count = 0 # Projects written so far
+
+    def write(self, project_detail):
+        self.batch.append(project_detail)
+        self.count += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.write_batch(self.batch)
+            self.batch = []
+
+    @abstractmethod
+    def write_batch(self, batch):
+        """Writes a batch of project details to the output file."""
+
+    def close(self):
+        self.flush()
+        logging.info(f"{self.count} project details written to: {self.filename}") # Info log
+
+
+class CsvProjectWriter(ProjectWriter):
+    """Writes project details to a CSV file, labels as a stringified dict."""
+
+    extension = "csv"
+
+    def __init__(self, filename=None, batch_size=WRITE_BATCH_SIZE):
+        super().__init__(filename, batch_size)
+        self.file = open(self.filename, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=PROJECT_COLUMNS)
+        self.writer.writeheader()
+
+    def write_batch(self, batch):
+        self.writer.writerows(batch)
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class JsonLinesProjectWriter(ProjectWriter):
+    """Writes project details to a JSON Lines file, one object per project."""
+
+    extension = "jsonl"
+
+    def __init__(self, filename=None, batch_size=WRITE_BATCH_SIZE):
+        super().__init__(filename, batch_size)
+        self.file = open(self.filename, 'w', encoding='utf-8')
+
+    def write_batch(self, batch):
+        self.file.write("".join(json.dumps(project_detail) + "\n" for project_detail in batch))
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class ParquetProjectWriter(ProjectWriter):
+    """Writes project details to a Parquet file, a row group per batch, labels as a
+    map<string, string> column. Needs pyarrow, which only this output imports."""
+
+    extension = "parquet"
+
+    def __init__(self, filename=None, batch_size=WRITE_BATCH_SIZE):
+        super().__init__(filename, batch_size)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("Parquet output needs pyarrow, install it with: pip install pyarrow") from e
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ("Project Display Name", pyarrow.string()),
+            ("Project ID", pyarrow.string()),
+            ("Billing Account ID Name", pyarrow.string()),
+            ("Labels", pyarrow.map_(pyarrow.string(), pyarrow.string())),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(self.filename, self.schema)
+
+    def write_batch(self, batch):
+        columns = {name: [project_detail[name] for project_detail in batch] for name in PROJECT_COLUMNS}
+        columns["Labels"] = [list(labels.items()) for labels in columns["Labels"]]
+        self.writer.write_table(self.pyarrow.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+
+PROJECT_WRITERS = {
+    "csv": CsvProjectWriter,
+    "jsonl": JsonLinesProjectWriter,
+    "parquet": ParquetProjectWriter,
+}
+
+
+# Project cache file (no cache when unset), how long cached billing info stays valid, and
+# whether to reuse unchanged projects (INCREMENTAL) and the last interrupted run (RESUME)
+CACHE_FILE = os.environ.get("CACHE_FILE")
+BILLING_TTL_HOURS = float(os.environ.get("BILLING_TTL_HOURS", "24"))
+INCREMENTAL = os.environ.get("INCREMENTAL", "0") == "1"
+RESUME = os.environ.get("RESUME", "0") == "1"
+
+
+class ProjectCache:
+    """SQLite cache of the project inventory, keyed by project ID. Every project fetched is
+    stored with its update_time and etag, and the run that last found it; in incremental mode a project listed with the same
+    ones is served from the cache, as long as its billing info is younger than the TTL.
+    Folders are checkpointed as they complete, so that an interrupted run can be resumed
+    without listing the completed folders again. Only used from the event loop thread."""
+
+    def __init__(self, filename, organization_id, incremental=INCREMENTAL, resume=RESUME,
+                 billing_ttl_hours=BILLING_TTL_HOURS):
+        self.connection = sqlite3.connect(filename)
+        self.organization_id = organization_id
+        self.incremental = incremental
+        self.billing_ttl = billing_ttl_hours * 3600
+        self.hits = 0
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS projects (
+                project_id TEXT PRIMARY KEY,
+                parent TEXT,
+                display_name TEXT,
+                labels TEXT,
+                update_time TEXT,
+                etag TEXT,
+                billing_account_name TEXT,
+                billing_fetched_at REAL,
+                run_id INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                organization_id TEXT,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS done_folders (
+                run_id INTEGER,
+                folder_name TEXT,
+                children TEXT,
+                PRIMARY KEY (run_id, folder_name)
+            );
+        """)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(projects)")]
+        if "run_id" not in columns: # Cache written before projects recorded their run
+            self.connection.execute("ALTER TABLE projects ADD COLUMN run_id INTEGER")
+        self.run_id = None
+        if resume:
+            # Only a run interrupted after the last complete one, an older run's cache is stale
+            row = self.connection.execute(
+                "SELECT max(run_id) FROM runs WHERE organization_id = ? AND finished_at IS NULL AND run_id > "
+                "(SELECT coalesce(max(run_id), 0) FROM runs WHERE organization_id = ? AND finished_at IS NOT NULL)",
+                (organization_id, organization_id),
+            ).fetchone()
+            self.run_id = row[0]
+            if self.run_id is not None:
+                logging.info(f"Resuming interrupted run {self.run_id} from cache: {filename}") # Info log
+        if self.run_id is None:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (organization_id, started_at) VALUES (?, ?)", (organization_id, time.time())
+            )
+            self.run_id = cursor.lastrowid
+        self.connection.commit()
+
+    @staticmethod
+    def version(project):
+        """The update_time and etag of a listed project, that change whenever it does."""
+        update_time = project.update_time.isoformat() if project.update_time else ""
+        return update_time, project.etag
+
+    def lookup(self, project, parent):
+        """Details of the project if the cache holds the same version with fresh billing info,
+        which is then recorded as seen by this run under parent."""
+        if not self.incremental:
+            return None
+        row = self.connection.execute(
+            "SELECT display_name, labels, update_time, etag, billing_account_name, billing_fetched_at "
+            "FROM projects WHERE project_id = ?",
+            (project.project_id,),
+        ).fetchone()
+        if row is None or (row[2], row[3]) != self.version(project):
+            return None # New or changed since it was cached
+        if row[5] is None or time.time() - row[5] > self.billing_ttl:
+            return None # Billing info expired, or failed to be fetched
+        self.connection.execute(
+            "UPDATE projects SET parent = ?, run_id = ? WHERE project_id = ?", (parent, self.run_id, project.project_id)
+        )
+        self.hits += 1
+        return self.project_detail(project.project_id, row[0], row[1], row[4])
+
+    def store(self, project, project_detail, parent):
+        update_time, etag = self.version(project)
+        billing_account_name = project_detail["Billing Account ID Name"]
+        fetched_at = None if billing_account_name in (BILLING_NOT_FOUND, BILLING_LOOKUP_FAILED) else time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                project.project_id,
+                parent,
+                project_detail["Project Display Name"],
+                json.dumps(project_detail["Labels"]),
+                update_time,
+                etag,
+                billing_account_name,
+                fetched_at,
+                self.run_id,
+            ),
+        )
+
+    @staticmethod
+    def project_detail(project_id, display_name, labels, billing_account_name):
+        return {
+            "Project Display Name": display_name,
+            "Project ID": project_id,
+            "Billing Account ID Name": billing_account_name,
+            "Labels": json.loads(labels),
+        }
+
+    def is_folder_done(self, folder_name):
+        return self.folder_children(folder_name) is not None
+
+    def folder_children(self, folder_name):
+        row = self.connection.execute(
+            "SELECT children FROM done_folders WHERE run_id = ? AND folder_name = ?", (self.run_id, folder_name)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def folder_projects(self, folder_name):
+        """Details of the projects this run found in a folder, not of ones an earlier run did."""
+        rows = self.connection.execute(
+            "SELECT project_id, display_name, labels, billing_account_name FROM projects "
+            "WHERE parent = ? AND run_id = ?",
+            (folder_name, self.run_id),
+        )
+        return [self.project_detail(*row) for row in rows]
+
+    def mark_folder_done(self, folder_name, child_names):
+        """Checkpoints a folder whose projects were all written, with the projects stored so far."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO done_folders VALUES (?, ?, ?)", (self.run_id, folder_name, json.dumps(child_names))
+        )
+        self.connection.commit()
+
+    def finish_run(self):
+        self.connection.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+        other_runs = "SELECT run_id FROM runs WHERE organization_id = ? AND run_id != ?"
+        self.connection.execute(
+            f"DELETE FROM done_folders WHERE run_id = ? OR run_id IN ({other_runs})",
+            (self.run_id, self.organization_id, self.run_id),
+        )
+        # Projects this complete run did not find were deleted, or moved out of the organization
+        self.connection.execute(f"DELETE FROM projects WHERE run_id IN ({other_runs})", (self.organization_id, self.run_id))
+        # Interrupted runs of the organization are abandoned, this run supersedes them
+        self.connection.execute(
+            "DELETE FROM runs WHERE organization_id = ? AND run_id != ? AND finished_at IS NULL",
+            (self.organization_id, self.run_id),
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+        logging.info(f"Projects served from cache: {self.hits}") # Info log
 
 
 async def main_async():
@@ -131,10 +770,27 @@ async def main_async():
         return
 
     logging.info(f"Script started for organization: {organization_id}") # Info log
-    project_details = await get_all_projects_async(organization_id)
-    logging.info(f"Total projects found: {len(project_details)}") # Info log
+    logging.info(f"Running at most {MAX_IN_FLIGHT_REQUESTS} requests at once") # Info log
+    if OUTPUT_FORMAT not in PROJECT_WRITERS:
+        print(f"Error: OUTPUT_FORMAT must be one of {', '.join(PROJECT_WRITERS)}")
+        return
 
-    write_projects_to_csv(project_details)
+    if BILLING_LOOKUP not in ("project", "account"):
+        print("Error: BILLING_LOOKUP must be one of project, account")
+        return
+
+    writer = PROJECT_WRITERS[OUTPUT_FORMAT](OUTPUT_FILE)
+    cache = ProjectCache(CACHE_FILE, organization_id) if CACHE_FILE else None
+    session = RpcSession()
+    try:
+        await get_all_projects_async(organization_id, session, writer, cache)
+    finally:
+        session.report()
+        session.close()
+        writer.close() # Flushes the last batch, even when the crawl failed
+        if cache is not None:
+            cache.close()
+    logging.info(f"Total projects found: {writer.count}") # Info log
     logging.info("Script completed.") # Info log
 
 
@@ -0,0 +1,617 @@
+"""
+Headless, deterministic referee for the Fall 2023 challenge (Seabed Security).
+
+It plays two bots against each other through the same stdin/stdout protocol
+as the CodinGame servers, so main.py can be run and measured locally. The
+rules follow the published statement closely enough to compare bot versions:
+fish and monster motion, scans, emergency mode, radar blips, battery/light and
+scoring with the first-to-save and combo bonuses.
+"""
+from __future__ import annotations
+import math
+import os
+import random
+import select
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class Rules:
+    MAP_SIZE = 10000
+    MAX_TURNS = 200
+    DRONES_PER_PLAYER = 2
+    DRONE_SPEED = 600
+    DRONE_SINK_SPEED = 300
+    DRONE_EMERGENCY_SPEED = 300
+    DRONE_MAX_BATTERY = 30
+    LIGHT_BATTERY_COST = 5
+    DARK_SCAN_RANGE = 800
+    LIGHT_SCAN_RANGE = 2000
+    SURFACE_Y = 500
+    FISH_SPEED = 200
+    FISH_FLEE_SPEED = 400
+    FISH_HEARING_RANGE = 1400
+    FISH_AVOID_RANGE = 600
+    MONSTER_SPEED = 270
+    MONSTER_ATTACK_SPEED = 540
+    MONSTER_ATTACK_RANGE = 500
+    MONSTER_DETECTION_BONUS = 300
+    MONSTER_AVOID_RANGE = 600
+    MONSTER_HABITAT_TOP = 2500
+    FISH_HABITATS = {0: (2500, 5000), 1: (5000, 7500), 2: (7500, 10000)}
+    FISH_COLORS = 4
+    TYPE_POINTS = {0: 1, 1: 2, 2: 3}
+    COLOR_COMBO_POINTS = 3
+    TYPE_COMBO_POINTS = 4
+    FIRST_TURN_TIMEOUT = 1.0
+    TURN_TIMEOUT = 0.05
+
+
+@dataclass
+class SimDrone:
+    drone_id: int
+    owner: int
+    x: int
+    y: int
+    battery: int = Rules.DRONE_MAX_BATTERY
+    emergency: bool = False
+    light: bool = False
+    target: Optional[Tuple[int, int]] = None
+    scans: List[int] = field(default_factory=list)
+
+    @property
+    def scan_range(self) -> int:
+        return Rules.LIGHT_SCAN_RANGE if self.light else Rules.DARK_SCAN_RANGE
+
+
+@dataclass
+class SimCreature:
+    creature_id: int
+    color: int
+    type: int
+    x: int
+    y: int
+    vx: int = 0
+    vy: int = 0
+    alive: bool = True
+
+    @property
+    def is_monster(self) -> bool:
+        return self.type == -1
+
+
+@dataclass
+class MatchResult:
+    seed: int
+    scores: Tuple[int, int]
+    turns: int
+    failed: Tuple[bool, bool]
+    latencies: Tuple[List[float], List[float]]
+
+    @property
+    def winner(self) -> Optional[int]:
+        if self.failed[0] != self.failed[1]:
+            return 1 if self.failed[0] else 0
+        if self.scores[0] == self.scores[1]:
+            return None
+        return 0 if self.scores[0] > self.scores[1] else 1
+
+
+def squared_distance(ax: float, ay: float, bx: float, by: float) -> float:
+    return (ax - bx) ** 2 + (ay - by) ** 2
+
+
+def scaled(dx: float, dy: float, length: float) -> Tuple[int, int]:
+    norm = math.hypot(dx, dy)
+    if norm == 0:
+        return 0, 0
+    return round(dx / norm * length), round(dy / norm * length)
+
+
+def segments_collide(
+    drone_from: Tuple[int, int],
+    drone_to: Tuple[int, int],
+    monster_from: Tuple[int, int],
+    monster_to: Tuple[int, int],
+    _range: int,
+) -> bool:
+    """
+    Whether a drone and a monster, both moving in a straight line during the
+    turn, come within range of each other at any time of the turn.
+    """
+    rx = drone_from[0] - monster_from[0]
+    ry = drone_from[1] - monster_from[1]
+    dx = (drone_to[0] - drone_from[0]) - (monster_to[0] - monster_from[0])
+    dy = (drone_to[1] - drone_from[1]) - (monster_to[1] - monster_from[1])
+    speed = dx * dx + dy * dy
+    t = 0.0 if speed == 0 else max(0.0, min(1.0, -(rx * dx + ry * dy) / speed))
+    return (rx + t * dx) ** 2 + (ry + t * dy) ** 2 <= _range * _range
+
+
+class Referee:
+    def __init__(self, seed: int, max_turns: int = Rules.MAX_TURNS) -> None:
+        self.random = random.Random(seed)
+        self.max_turns = max_turns
+        self.turn = 0
+        self.drones: List[SimDrone] = []
+        self.creatures: Dict[int, SimCreature] = {}
+        self.saved: Tuple[Dict[int, int], Dict[int, int]] = ({}, {})
+        self.create_drones()
+        self.create_creatures()
+
+    def create_drones(self) -> None:
+        drone_id = 0
+        for owner in range(2):
+            for x in (2000, 5500)[: Rules.DRONES_PER_PLAYER]:
+                if owner == 1:
+                    x = Rules.MAP_SIZE - 1 - x
+                self.drones.append(SimDrone(drone_id, owner, x, Rules.SURFACE_Y))
+                drone_id += 1
+
+    def create_creatures(self) -> None:
+        creature_id = len(self.drones)
+        for _type, (top, bottom) in Rules.FISH_HABITATS.items():
+            for color in range(0, Rules.FISH_COLORS, 2):
+                x = self.random.randrange(Rules.MAP_SIZE)
+                y = self.random.randrange(top + 200, bottom - 200)
+                vx, vy = scaled(
+                    self.random.uniform(-1, 1),
+                    self.random.uniform(-1, 1),
+                    Rules.FISH_SPEED,
+                )
+                for mirror in range(2):
+                    self.creatures[creature_id] = SimCreature(
+                        creature_id,
+                        color + mirror,
+                        _type,
+                        Rules.MAP_SIZE - 1 - x if mirror else x,
+                        y,
+                        -vx if mirror else vx,
+                        vy,
+                    )
+                    creature_id += 1
+
+        for _ in range(self.random.randint(1, 3)):
+            x = self.random.randrange(Rules.MAP_SIZE)
+            y = self.random.randrange(5000, Rules.MAP_SIZE)
+            vx, vy = scaled(
+                self.random.uniform(-1, 1),
+                self.random.uniform(-1, 1),
+                Rules.MONSTER_SPEED,
+            )
+            for mirror in range(2):
+                self.creatures[creature_id] = SimCreature(
+                    creature_id,
+                    -1,
+                    -1,
+                    Rules.MAP_SIZE - 1 - x if mirror else x,
+                    y,
+                    -vx if mirror else vx,
+                    vy,
+                )
+                creature_id += 1
+
+    @property
+    def fish(self) -> List[SimCreature]:
+        return [c for c in self.creatures.values() if not c.is_monster]
+
+    @property
+    def monsters(self) -> List[SimCreature]:
+        return [c for c in self.creatures.values() if c.is_monster]
+
+    def player_drones(self, player: int) -> List[SimDrone]:
+        return [drone for drone in self.drones if drone.owner == player]
+
+    # Protocol
+
+    def initial_input(self) -> str:
+        lines = [str(len(self.creatures))]
+        for creature in self.creatures.values():
+            lines.append(f"{creature.creature_id} {creature.color} {creature.type}")
+        return "\n".join(lines) + "\n"
+
+    def turn_input(self, player: int) -> str:
+        foe = 1 - player
+        scores = self.scores()
+        lines = [str(scores[player]), str(scores[foe])]
+        for owner in (player, foe):
+            lines.append(str(len(self.saved[owner])))
+            lines.extend(str(creature_id) for creature_id in self.saved[owner])
+        for owner in (player, foe):
+            drones = self.player_drones(owner)
+            lines.append(str(len(drones)))
+            for drone in drones:
+                lines.append(
+                    f"{drone.drone_id} {drone.x} {drone.y} {int(drone.emergency)} {drone.battery}"
+                )
+
+        drone_scans = [
+            f"{drone.drone_id} {creature_id}"
+            for drone in self.drones
+            for creature_id in drone.scans
+        ]
+        lines.append(str(len(drone_scans)))
+        lines.extend(drone_scans)
+
+        my_drones = self.player_drones(player)
+        visible = [
+            creature
+            for creature in self.creatures.values()
+            if creature.alive
+            and any(
+                squared_distance(creature.x, creature.y, drone.x, drone.y)
+                <= drone.scan_range**2
+                for drone in my_drones
+            )
+        ]
+        lines.append(str(len(visible)))
+        for creature in visible:
+            lines.append(
+                f"{creature.creature_id} {creature.x} {creature.y} {creature.vx} {creature.vy}"
+            )
+
+        blips = [
+            f"{drone.drone_id} {creature.creature_id} "
+            f"{'T' if creature.y < drone.y else 'B'}{'L' if creature.x < drone.x else 'R'}"
+            for drone in my_drones
+            for creature in self.creatures.values()
+            if creature.alive
+        ]
+        lines.append(str(len(blips)))
+        lines.extend(blips)
+        return "\n".join(lines) + "\n"
+
+    def apply_actions(self, player: int, actions: List[str]) -> None:
+        for drone, action in zip(self.player_drones(player), actions):
+            drone.target = None
+            drone.light = False
+            if drone.emergency:
+                continue
+            tokens = action.split()
+            if tokens[0] == "MOVE":
+                drone.target = (int(tokens[1]), int(tokens[2]))
+                light = tokens[3] if len(tokens) > 3 else "0"
+            elif tokens[0] == "WAIT":
+                light = tokens[1] if len(tokens) > 1 else "0"
+            else:
+                raise ValueError(f"Unsupported action {action}")
+            drone.light = light == "1" and drone.battery >= Rules.LIGHT_BATTERY_COST
+
+    # Simulation
+
+    def next_drone_position(self, drone: SimDrone) -> Tuple[int, int]:
+        if drone.emergency:
+            return drone.x, max(0, drone.y - Rules.DRONE_EMERGENCY_SPEED)
+        if drone.target is None:
+            x, y = drone.x, drone.y + Rules.DRONE_SINK_SPEED
+        else:
+            dx = drone.target[0] - drone.x
+            dy = drone.target[1] - drone.y
+            if dx * dx + dy * dy <= Rules.DRONE_SPEED**2:
+                x, y = drone.target
+            else:
+                step_x, step_y = scaled(dx, dy, Rules.DRONE_SPEED)
+                x, y = drone.x + step_x, drone.y + step_y
+        last = Rules.MAP_SIZE - 1
+        return max(0, min(last, x)), max(0, min(last, y))
+
+    def step(self) -> None:
+        self.turn += 1
+        destinations = {
+            drone.drone_id: self.next_drone_position(drone) for drone in self.drones
+        }
+
+        for drone in self.drones:
+            if drone.emergency:
+                continue
+            for monster in self.monsters:
+                if segments_collide(
+                    (drone.x, drone.y),
+                    destinations[drone.drone_id],
+                    (monster.x, monster.y),
+                    (monster.x + monster.vx, monster.y + monster.vy),
+                    Rules.MONSTER_ATTACK_RANGE,
+                ):
+                    drone.emergency = True
+                    drone.scans.clear()
+                    break
+
+        for drone in self.drones:
+            drone.x, drone.y = destinations[drone.drone_id]
+            if drone.light:
+                drone.battery -= Rules.LIGHT_BATTERY_COST
+            else:
+                drone.battery = min(Rules.DRONE_MAX_BATTERY, drone.battery + 1)
+        for creature in self.creatures.values():
+            if creature.alive:
+                self.move_creature(creature)
+
+        self.scan()
+        for drone in self.drones:
+            if drone.y <= Rules.SURFACE_Y:
+                drone.emergency = False
+                self.save(drone)
+
+        for creature in self.fish:
+            if creature.alive:
+                self.update_fish_speed(creature)
+        for creature in self.monsters:
+            self.update_monster_speed(creature)
+
+        if self.is_over():
+            for drone in self.drones:
+                self.save(drone)
+
+    def move_creature(self, creature: SimCreature) -> None:
+        creature.x += creature.vx
+        creature.y += creature.vy
+        if creature.is_monster:
+            top, bottom = Rules.MONSTER_HABITAT_TOP, Rules.MAP_SIZE - 1
+            creature.x = max(0, min(Rules.MAP_SIZE - 1, creature.x))
+        else:
+            top, bottom = Rules.FISH_HABITATS[creature.type]
+            if not 0 <= creature.x < Rules.MAP_SIZE:
+                creature.alive = False
+        creature.y = max(top, min(bottom, creature.y))
+
+    def scan(self) -> None:
+        for drone in self.drones:
+            if drone.emergency:
+                continue
+            for creature in self.fish:
+                if (
+                    creature.alive
+                    and creature.creature_id not in self.saved[drone.owner]
+                    and creature.creature_id not in drone.scans
+                    and squared_distance(creature.x, creature.y, drone.x, drone.y)
+                    <= drone.scan_range**2
+                ):
+                    drone.scans.append(creature.creature_id)
+
+    def save(self, drone: SimDrone) -> None:
+        for creature_id in drone.scans:
+            self.saved[drone.owner].setdefault(creature_id, self.turn)
+        drone.scans.clear()
+
+    def update_fish_speed(self, fish: SimCreature) -> None:
+        active = [drone for drone in self.drones if not drone.emergency]
+        scared_by = [
+            drone
+            for drone in active
+            if squared_distance(fish.x, fish.y, drone.x, drone.y)
+            <= Rules.FISH_HEARING_RANGE**2
+        ]
+        top, bottom = Rules.FISH_HABITATS[fish.type]
+        if scared_by:
+            away_x = sum(fish.x - drone.x for drone in scared_by)
+            away_y = sum(fish.y - drone.y for drone in scared_by)
+            fish.vx, fish.vy = scaled(away_x, away_y, Rules.FISH_FLEE_SPEED)
+        else:
+            neighbours = [
+                other
+                for other in self.fish
+                if other is not fish
+                and other.alive
+                and squared_distance(fish.x, fish.y, other.x, other.y)
+                <= Rules.FISH_AVOID_RANGE**2
+            ]
+            if neighbours:
+                closest = min(
+                    neighbours,
+                    key=lambda other: squared_distance(
+                        fish.x, fish.y, other.x, other.y
+                    ),
+                )
+                fish.vx, fish.vy = scaled(
+                    fish.x - closest.x, fish.y - closest.y, Rules.FISH_SPEED
+                )
+            else:
+                fish.vx, fish.vy = scaled(fish.vx, fish.vy, Rules.FISH_SPEED)
+            if not 0 <= fish.x + fish.vx < Rules.MAP_SIZE:
+                fish.vx = -fish.vx
+        if not top <= fish.y + fish.vy <= bottom:
+            fish.vy = -fish.vy
+
+    def update_monster_speed(self, monster: SimCreature) -> None:
+        targets = [
+            drone
+            for drone in self.drones
+            if not drone.emergency
+            and squared_distance(monster.x, monster.y, drone.x, drone.y)
+            <= (drone.scan_range + Rules.MONSTER_DETECTION_BONUS) ** 2
+        ]
+        if targets:
+            target = min(
+                targets,
+                key=lambda drone: squared_distance(
+                    monster.x, monster.y, drone.x, drone.y
+                ),
+            )
+            monster.vx, monster.vy = scaled(
+                target.x - monster.x, target.y - monster.y, Rules.MONSTER_ATTACK_SPEED
+            )
+        else:
+            others = [
+                other
+                for other in self.monsters
+                if other is not monster
+                and squared_distance(monster.x, monster.y, other.x, other.y)
+                <= Rules.MONSTER_AVOID_RANGE**2
+            ]
+            if others:
+                closest = min(
+                    others,
+                    key=lambda other: squared_distance(
+                        monster.x, monster.y, other.x, other.y
+                    ),
+                )
+                monster.vx, monster.vy = scaled(
+                    monster.x - closest.x, monster.y - closest.y, Rules.MONSTER_SPEED
+                )
+            elif monster.vx or monster.vy:
+                monster.vx, monster.vy = scaled(
+                    monster.vx, monster.vy, Rules.MONSTER_SPEED
+                )
+            if not 0 <= monster.x + monster.vx < Rules.MAP_SIZE:
+                monster.vx = -monster.vx
+        if not Rules.MONSTER_HABITAT_TOP <= monster.y + monster.vy < Rules.MAP_SIZE:
+            monster.vy = -monster.vy
+
+    # Scoring
+
+    def remaining_to_save(self, player: int) -> Set[int]:
+        remaining = {
+            fish.creature_id
+            for fish in self.fish
+            if fish.alive and fish.creature_id not in self.saved[player]
+        }
+        for drone in self.player_drones(player):
+            remaining.update(drone.scans)
+        return remaining
+
+    def is_over(self) -> bool:
+        if self.turn >= self.max_turns:
+            return True
+        return not self.remaining_to_save(0) and not self.remaining_to_save(1)
+
+    def completion_turn(self, player: int, creature_ids: List[int]) -> Optional[int]:
+        turns = [self.saved[player].get(creature_id) for creature_id in creature_ids]
+        return None if None in turns else max(turns)
+
+    def player_score(self, player: int) -> int:
+        foe = 1 - player
+
+        def bonus(points: int, creature_ids: List[int]) -> int:
+            mine = self.completion_turn(player, creature_ids)
+            if mine is None:
+                return 0
+            theirs = self.completion_turn(foe, creature_ids)
+            return points * 2 if theirs is None or mine <= theirs else points
+
+        score = 0
+        fish = self.fish
+        for creature in fish:
+            score += bonus(Rules.TYPE_POINTS[creature.type], [creature.creature_id])
+        for color in range(Rules.FISH_COLORS):
+            group = [c.creature_id for c in fish if c.color == color]
+            score += bonus(Rules.COLOR_COMBO_POINTS, group)
+        for _type in Rules.FISH_HABITATS:
+            group = [c.creature_id for c in fish if c.type == _type]
+            score += bonus(Rules.TYPE_COMBO_POINTS, group)
+        return score
+
+    def scores(self) -> Tuple[int, int]:
+        return self.player_score(0), self.player_score(1)
+
+
+class BotProcess:
+    """
+    A bot running as a child process, talking the referee protocol over pipes.
+    """
+
+    def __init__(
+        self, command: List[str], env: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+        )
+        self.buffer = b""
+
+    def send(self, text: str) -> None:
+        self.process.stdin.write(text.encode())
+        self.process.stdin.flush()
+
+    def receive(self, line_count: int, timeout: Optional[float]) -> List[str]:
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        fd = self.process.stdout.fileno()
+        while self.buffer.count(b"\n") < line_count:
+            remaining = (
+                None if deadline is None else max(0.0, deadline - time.perf_counter())
+            )
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                raise TimeoutError(f"Bot did not answer within {timeout}s")
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                raise EOFError("Bot closed its output")
+            self.buffer += chunk
+        lines = self.buffer.split(b"\n")
+        self.buffer = b"\n".join(lines[line_count:])
+        return [line.decode().strip() for line in lines[:line_count]]
+
+    def close(self) -> None:
+        # Closing stdin lets the bot see the end of the game and flush its files.
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except (BrokenPipeError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+def bot_command(path: str) -> List[str]:
+    return [sys.executable, "-u", path]
+
+
+def play_match(
+    seed: int,
+    bots: Tuple[str, str],
+    max_turns: int = Rules.MAX_TURNS,
+    timeouts: bool = True,
+    records: Tuple[Optional[str], Optional[str]] = (None, None),
+) -> MatchResult:
+    """
+    Play one seeded match between two bot scripts and return its result.
+    A bot that crashes, answers garbage or (with timeouts) is too slow
+    loses the match.
+    """
+    referee = Referee(seed, max_turns=max_turns)
+    processes = [
+        BotProcess(
+            bot_command(path),
+            None if record is None else {**os.environ, "BOT_RECORD": record},
+        )
+        for path, record in zip(bots, records)
+    ]
+    failed = [False, False]
+    latencies: Tuple[List[float], List[float]] = ([], [])
+    try:
+        initial_input = referee.initial_input()
+        for process in processes:
+            process.send(initial_input)
+        while not referee.is_over() and not any(failed):
+            for player, process in enumerate(processes):
+                timeout = None
+                if timeouts:
+                    timeout = (
+                        Rules.FIRST_TURN_TIMEOUT
+                        if referee.turn == 0
+                        else Rules.TURN_TIMEOUT
+                    )
+                started = time.perf_counter()
+                try:
+                    process.send(referee.turn_input(player))
+                    actions = process.receive(Rules.DRONES_PER_PLAYER, timeout)
+                    referee.apply_actions(player, actions)
+                except (
+                    TimeoutError,
+                    EOFError,
+                    BrokenPipeError,
+                    ValueError,
+                    IndexError,
+                ):
+                    failed[player] = True
+                    continue
+                latencies[player].append((time.perf_counter() - started) * 1000)
+            referee.step()
+    finally:
+        for process in processes:
+            process.close()
+    return MatchResult(seed, referee.scores(), referee.turn, tuple(failed), latencies)
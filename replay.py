@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Plays a game recorded by a bot running with BOT_RECORD back through the Game
+of a bot script, offline and turn by turn, and reports what every turn cost.
+
+    python replay.py games/seed-12.replay.gz --bot main.py
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from contextlib import redirect_stderr
+from dataclasses import dataclass
+from itertools import count
+from types import ModuleType
+from typing import Deque, List, Optional
+
+_module_ids = count()
+
+
+@dataclass
+class RecordedTurn:
+    turn: int
+    input: str
+    output: List[str]
+
+
+@dataclass
+class Replay:
+    path: str
+    init: str
+    turns: List[RecordedTurn]
+
+
+@dataclass
+class TurnResult:
+    turn: int
+    latency: float
+    peak_memory: Optional[int]
+    output: List[str]
+
+
+def load_replay(path: str) -> Replay:
+    init = ""
+    turns: List[RecordedTurn] = []
+    with gzip.open(path, "rt", encoding="utf-8") as replay_file:
+        try:
+            for line in replay_file:
+                entry = json.loads(line)
+                if "init" in entry:
+                    init = entry["init"]
+                else:
+                    turns.append(
+                        RecordedTurn(entry["turn"], entry["input"], entry["output"])
+                    )
+        except EOFError:
+            # The bot was killed mid-game, every turn it flushed is still there.
+            pass
+    return Replay(path, init, turns)
+
+
+def load_bot(path: str) -> ModuleType:
+    """
+    Import a bot script under a module name of its own, so that several
+    versions of the bot can be compared in the same process.
+    """
+    spec = importlib.util.spec_from_file_location(
+        f"replayed_bot_{next(_module_ids)}", path
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class TurnFeed:
+    """
+    Binary stream handing the bot one recorded block of input per read, as the
+    referee would write it, so that the bot turn clock starts at each turn.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: Deque[bytes] = deque()
+
+    def push(self, text: str) -> None:
+        self.chunks.append(text.encode() + b"\n")
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.chunks.popleft() if self.chunks else b""
+
+
+def replay_game(
+    replay: Replay, bot: ModuleType, trace_memory: bool = False
+) -> List[TurnResult]:
+    """
+    Feed the recorded turns to a fresh instance of the bot and return the latency
+    of every turn, its peak memory when traced, and the actions played.
+    """
+    feed = TurnFeed()
+    out = io.StringIO()
+    results: List[TurnResult] = []
+    # The bot talks a lot on stderr, that does not matter here.
+    with redirect_stderr(io.StringIO()):
+        feed.push(replay.init)
+        player = bot.Bot.from_stream(feed, out)
+        for recorded in replay.turns:
+            feed.push(recorded.input)
+            if trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            actions = player.play_turn()
+            latency = time.perf_counter() - started
+            peak_memory = None
+            if trace_memory:
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            results.append(TurnResult(recorded.turn, latency, peak_memory, actions))
+            out.seek(0)
+            out.truncate()
+        player.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("replay")
+    parser.add_argument("--bot", default="main.py")
+    parser.add_argument(
+        "--log", metavar="PATH", help="Write the bot log as JSON lines to this file"
+    )
+    parser.add_argument(
+        "--log-level", default="debug", help="Level of the messages written to --log"
+    )
+    args = parser.parse_args()
+    if args.log:
+        os.environ["BOT_LOG_JSON"] = args.log
+        os.environ["BOT_LOG_LEVEL"] = args.log_level
+
+    replay = load_replay(args.replay)
+    results = replay_game(replay, load_bot(args.bot))
+    for recorded, result in zip(replay.turns, results):
+        marker = "" if result.output == recorded.output else "  differs from recording"
+        print(
+            f"turn {result.turn:3} {result.latency * 1000:7.2f}ms {result.output}{marker}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Plays many seeded matches between two bots on all cores and reports win rate,
+mean score and per-turn latency percentiles of the first bot.
+
+    python run_matches.py --games 2000 --bot main.py --opponent old_main.py
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing
+import os
+from functools import partial
+from typing import List, Optional, Sequence
+
+from referee import MatchResult, Rules, play_match
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def play_seed(
+    seed: int,
+    bot: str,
+    opponent: str,
+    max_turns: int,
+    timeouts: bool,
+    record_dir: Optional[str],
+) -> MatchResult:
+    record = None
+    if record_dir is not None:
+        record = os.path.join(record_dir, f"seed-{seed}.replay.gz")
+    # Alternate sides so a positional advantage of the referee cannot bias the results.
+    if seed % 2 == 0:
+        return play_match(seed, (bot, opponent), max_turns, timeouts, (record, None))
+    result = play_match(seed, (opponent, bot), max_turns, timeouts, (None, record))
+    return MatchResult(
+        result.seed,
+        result.scores[::-1],
+        result.turns,
+        result.failed[::-1],
+        result.latencies[::-1],
+    )
+
+
+def report(results: List[MatchResult]) -> None:
+    games = len(results)
+    wins = sum(1 for result in results if result.winner == 0)
+    draws = sum(1 for result in results if result.winner is None)
+    losses = games - wins - draws
+    my_score = sum(result.scores[0] for result in results) / games
+    foe_score = sum(result.scores[1] for result in results) / games
+    failures = sum(1 for result in results if result.failed[0])
+    first_turn = [result.latencies[0][0] for result in results if result.latencies[0]]
+    turns = [latency for result in results for latency in result.latencies[0][1:]]
+
+    print(f"Games:      {games}")
+    print(f"Win rate:   {wins / games:.1%} ({wins} won, {draws} drawn, {losses} lost)")
+    print(f"Failures:   {failures} (crash or timeout)")
+    print(f"Mean score: {my_score:.1f} vs {foe_score:.1f}")
+    print(f"Mean turns: {sum(result.turns for result in results) / games:.1f}")
+    print(
+        f"First turn: p50 {percentile(first_turn, 0.5):.2f}ms "
+        f"p99 {percentile(first_turn, 0.99):.2f}ms"
+    )
+    print(
+        f"Turn:       p50 {percentile(turns, 0.5):.2f}ms "
+        f"p90 {percentile(turns, 0.9):.2f}ms "
+        f"p99 {percentile(turns, 0.99):.2f}ms "
+        f"max {max(turns, default=0.0):.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first game")
+    parser.add_argument("--bot", default="main.py")
+    parser.add_argument("--opponent", default="main.py")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--max-turns", type=int, default=Rules.MAX_TURNS)
+    parser.add_argument(
+        "--no-timeouts",
+        action="store_true",
+        help="Do not forfeit bots that exceed the turn time limit",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="Record the games of the bot as replay files in this directory",
+    )
+    args = parser.parse_args()
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+
+    play = partial(
+        play_seed,
+        bot=args.bot,
+        opponent=args.opponent,
+        max_turns=args.max_turns,
+        timeouts=not args.no_timeouts,
+        record_dir=args.record,
+    )
+    seeds = range(args.seed, args.seed + args.games)
+    with multiprocessing.Pool(args.processes) as pool:
+        results = list(pool.imap_unordered(play, seeds, chunksize=4))
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
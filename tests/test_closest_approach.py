@@ -0,0 +1,70 @@
+"""
+closest_approach against the referee's own check of a drone and a monster
+coming in range during a turn, on random moves.
+"""
+import random
+
+import numpy as np
+
+from main import Consts, Location, closest_approach
+from referee import segments_collide
+
+
+def test_closest_approach_matches_referee() -> None:
+    generator = random.Random(0)
+    range_squared = Consts.MONSTER_ATTACK_RANGE**2
+    mismatches = 0
+    collisions = 0
+    for _ in range(2500):
+        origin = Location(
+            generator.randrange(Consts.MAP_SIZE), generator.randrange(Consts.MAP_SIZE)
+        )
+        ends = np.array(
+            [
+                (
+                    origin.x + generator.randint(-600, 600),
+                    origin.y + generator.randint(-600, 600),
+                )
+                for _ in range(8)
+            ],
+            dtype=np.int64,
+        )
+        monsters = np.array(
+            [
+                (
+                    origin.x + generator.randint(-2000, 2000),
+                    origin.y + generator.randint(-2000, 2000),
+                )
+                for _ in range(4)
+            ],
+            dtype=np.int64,
+        )
+        speeds = np.array(
+            [
+                (
+                    generator.randint(
+                        -Consts.MONSTER_MAX_SPEED, Consts.MONSTER_MAX_SPEED
+                    ),
+                    generator.randint(
+                        -Consts.MONSTER_MAX_SPEED, Consts.MONSTER_MAX_SPEED
+                    ),
+                )
+                for _ in range(4)
+            ],
+            dtype=np.int64,
+        )
+        in_range = closest_approach(origin, ends, monsters, speeds) <= range_squared
+        for i, end in enumerate(ends):
+            for j, (monster, speed) in enumerate(zip(monsters, speeds)):
+                collide = segments_collide(
+                    (origin.x, origin.y),
+                    tuple(end),
+                    tuple(monster),
+                    tuple(monster + speed),
+                    Consts.MONSTER_ATTACK_RANGE,
+                )
+                mismatches += collide != in_range[i, j]
+                collisions += collide
+    assert mismatches == 0
+    # Both outcomes are well represented, so that the agreement means something.
+    assert 2000 < collisions < 18000
@@ -0,0 +1,28 @@
+"""
+hungarian against a brute force search of every assignment, on random costs.
+"""
+import random
+from itertools import permutations
+
+from main import hungarian
+
+
+def test_hungarian_matches_brute_force() -> None:
+    generator = random.Random(0)
+    for _ in range(2000):
+        rows = generator.randint(1, 4)
+        columns = generator.randint(rows, 6)
+        # Small integer costs, so that ties between assignments are common.
+        cost = [
+            [float(generator.randint(0, 9)) for _ in range(columns)]
+            for _ in range(rows)
+        ]
+        assignment = hungarian(cost)
+        assert len(assignment) == rows
+        assert len(set(assignment)) == rows
+        assert all(0 <= column < columns for column in assignment)
+        best = min(
+            sum(cost[row][column] for row, column in enumerate(columns_used))
+            for columns_used in permutations(range(columns), rows)
+        )
+        assert sum(cost[row][column] for row, column in enumerate(assignment)) == best
@@ -0,0 +1,129 @@
+"""
+Interrupted and resumed crawls of a fake organization with a ProjectCache.
+"""
+import asyncio
+import json
+import sqlite3
+from typing import List, Optional
+
+import pytest
+
+import map_projects
+from fake_gcp import FakeGcp, FakeOrganization
+
+
+class Interrupted(Exception):
+    pass
+
+
+def crawl(
+    fakes: FakeGcp,
+    cache_file: str,
+    output: str,
+    resume: bool,
+    interrupt_after: Optional[int] = None,
+) -> List[str]:
+    """
+    Crawls the organization of the fakes, stopped after interrupt_after folders
+    are checkpointed when given, and returns the project IDs written.
+    """
+    org = fakes.org
+    cache = map_projects.ProjectCache(cache_file, org.organization_id, resume=resume)
+    if interrupt_after is not None:
+        mark_folder_done = cache.mark_folder_done
+
+        def interrupting(folder_name, child_names):
+            mark_folder_done(folder_name, child_names)
+            interrupting.done += 1
+            if interrupting.done >= interrupt_after:
+                raise Interrupted
+
+        interrupting.done = 0
+        cache.mark_folder_done = interrupting
+    rate_limits = {api: float("inf") for api in map_projects.API_RATE_LIMITS}
+    session = map_projects.RpcSession(
+        1, map_projects.ClientRegistry(*fakes.clients()), rate_limits
+    )
+    writer = map_projects.JsonLinesProjectWriter(output)
+    try:
+        asyncio.run(
+            map_projects.get_all_projects_async(
+                org.organization_id, session, writer, cache, "project"
+            )
+        )
+    finally:
+        session.close()
+        writer.close()
+        cache.close()
+    with open(output, encoding="utf-8") as file:
+        return [json.loads(line)["Project ID"] for line in file]
+
+
+@pytest.fixture
+def fakes() -> FakeGcp:
+    return FakeGcp(FakeOrganization.generate(projects=60, depth=2), latency=0.0)
+
+
+def test_resume_skips_completed_folders(fakes: FakeGcp, tmp_path) -> None:
+    cache_file = str(tmp_path / "cache.sqlite")
+    output = str(tmp_path / "projects.jsonl")
+    with pytest.raises(Interrupted):
+        crawl(fakes, cache_file, output, resume=False, interrupt_after=3)
+    fakes.rpcs.clear()
+
+    project_ids = crawl(fakes, cache_file, output, resume=True)
+
+    assert sorted(project_ids) == sorted(
+        project.project_id
+        for projects in fakes.org.projects.values()
+        for project in projects
+    )
+    # The 3 folders completed before the interruption are not listed again.
+    assert fakes.rpcs["list_projects"] == len(fakes.org.projects) - 3
+
+
+def test_resume_drops_projects_of_earlier_runs(fakes: FakeGcp, tmp_path) -> None:
+    cache_file = str(tmp_path / "cache.sqlite")
+    output = str(tmp_path / "projects.jsonl")
+    crawl(fakes, cache_file, output, resume=False)
+    # Delete a project of every folder, whichever gets checkpointed first.
+    deleted = set()
+    for projects in fakes.org.projects.values():
+        if projects:
+            deleted.add(projects.pop(0).project_id)
+    with pytest.raises(Interrupted):
+        crawl(fakes, cache_file, output, resume=True, interrupt_after=1)
+
+    project_ids = crawl(fakes, cache_file, output, resume=True)
+
+    assert not deleted.intersection(project_ids)
+    assert len(project_ids) == len(set(project_ids)) == fakes.org.project_count
+
+
+def test_resume_ignores_runs_older_than_a_finished_one(
+    fakes: FakeGcp, tmp_path
+) -> None:
+    cache_file = str(tmp_path / "cache.sqlite")
+    output = str(tmp_path / "projects.jsonl")
+    with pytest.raises(Interrupted):
+        crawl(fakes, cache_file, output, resume=False, interrupt_after=3)
+    assert len(crawl(fakes, cache_file, output, resume=False)) == 60
+    with sqlite3.connect(cache_file) as connection:
+        # The complete run abandoned the interrupted one.
+        assert connection.execute(
+            "SELECT count(*) FROM runs WHERE finished_at IS NULL"
+        ).fetchone() == (0,)
+        assert connection.execute("SELECT count(*) FROM done_folders").fetchone() == (
+            0,
+        )
+    fakes.rpcs.clear()
+
+    project_ids = crawl(fakes, cache_file, output, resume=True)
+
+    # A new run, nothing left to resume since the complete one.
+    assert sorted(project_ids) == sorted(
+        project.project_id
+        for projects in fakes.org.projects.values()
+        for project in projects
+    )
+    assert fakes.rpcs["list_projects"] == len(fakes.org.projects)
@@ -0,0 +1,60 @@
+"""
+ProtocolReader on input that arrives in chunks cut anywhere, tokens included.
+"""
+import io
+import random
+from typing import List
+
+import pytest
+
+from main import ProtocolReader
+
+
+class ChunkedStream(io.RawIOBase):
+    """
+    Hands out the payload in chunks of the given sizes, as a pipe may.
+    """
+
+    def __init__(self, payload: bytes, sizes: List[int]) -> None:
+        self.payload = payload
+        self.sizes = sizes
+        self.position = 0
+
+    def read1(self, size: int = -1) -> bytes:
+        length = min(size, self.sizes[self.position % len(self.sizes)])
+        chunk = self.payload[self.position : self.position + length]
+        self.position += len(chunk)
+        return chunk
+
+
+def test_tokens_split_across_chunks() -> None:
+    generator = random.Random(0)
+    for _ in range(500):
+        tokens = [
+            str(generator.randint(-10000, 10000))
+            if generator.random() < 0.8
+            else generator.choice(["MOVE", "WAIT", "TL", "BR"])
+            for _ in range(generator.randint(1, 60))
+        ]
+        separators = [generator.choice([" ", "\n", "  ", " \n"]) for _ in tokens]
+        payload = "".join(
+            token + separator for token, separator in zip(tokens, separators)
+        )
+        if generator.random() < 0.5:
+            payload = payload.rstrip()  # No separator after the last token
+        sizes = [generator.randint(1, 8) for _ in range(5)]
+        reader = ProtocolReader(ChunkedStream(payload.encode(), sizes))
+        for token in tokens:
+            if token.lstrip("-").isdigit():
+                assert reader.next_int() == int(token)
+            else:
+                assert reader.next_str() == token
+        with pytest.raises(EOFError):
+            reader.next_str()
+
+
+def test_next_ints_waits_for_every_token() -> None:
+    reader = ProtocolReader(ChunkedStream(b"12 345\n6789 0\n", [3]))
+    assert reader.next_ints(4) == [12, 345, 6789, 0]
+    with pytest.raises(EOFError):
+        reader.next_int()